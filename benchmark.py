@@ -0,0 +1,262 @@
+"""
+Performance benchmarks of reference system topologies. Each benchmark builds a
+parameterized system, simulates it, and reports the wall time, number of events executed,
+events per second, and peak memory allocated during the simulation. Replication sweeps
+report replications per second for different numbers of jobs.
+
+Results are printed and saved as JSON so that they can be compared between versions:
+
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from simantha import Source, Machine, Buffer, Sink, Maintainer, System, utils
+
+# Machines fail after 400 time units on average
+degradation_matrix = [
+    [0.99, 0.01, 0.,   0.,   0.  ],
+    [0.,   0.99, 0.01, 0.,   0.  ],
+    [0.,   0.,   0.99, 0.01, 0.  ],
+    [0.,   0.,   0.,   0.99, 0.01],
+    [0.,   0.,   0.,   0.,   1.  ]
+]
+
+def serial_line(
+    machines=10, buffer_capacity=5, cbm_threshold=None, capacity=float('inf')
+):
+    """A line of degrading machines separated by buffers."""
+    source = Source()
+    line = [
+        Machine(
+            f'M{m}',
+            cycle_time=1,
+            degradation_matrix=degradation_matrix,
+            cbm_threshold=cbm_threshold,
+            pm_distribution={'geometric': 0.25},
+            cm_distribution={'geometric': 0.1}
+        )
+        for m in range(machines)
+    ]
+    buffers = [Buffer(f'B{m}', capacity=buffer_capacity) for m in range(machines-1)]
+    sink = Sink()
+
+    # Alternate machines and buffers between the source and sink
+    assets = [source]
+    for machine, buffer in zip(line, buffers):
+        assets += [machine, buffer]
+    assets += [line[-1], sink]
+
+    source.define_routing(downstream=[assets[1]])
+    for upstream, asset, downstream in zip(assets, assets[1:], assets[2:]):
+        asset.define_routing(upstream=[upstream], downstream=[downstream])
+    sink.define_routing(upstream=[assets[-2]])
+
+    return System(assets, maintainer=Maintainer(capacity=capacity))
+
+def parallel_stations(width=10, stations=3, buffer_capacity=5):
+    """Stations of identical parallel machines separated by buffers, as in the
+    ParallelStations example.
+    """
+    source = Source()
+    layout = []
+    for s in range(stations):
+        layout.append([Machine(f'M{s}_{m}', cycle_time=2+s%2) for m in range(width)])
+        if s < stations - 1:
+            layout.append([Buffer(f'B{s}', capacity=buffer_capacity)])
+    sink = Sink()
+    layout = [[source]] + layout + [[sink]]
+
+    source.define_routing(downstream=layout[1])
+    for upstream, stage, downstream in zip(layout, layout[1:], layout[2:]):
+        for asset in stage:
+            asset.define_routing(upstream=upstream, downstream=downstream)
+    sink.define_routing(upstream=layout[-2])
+
+    return System([asset for stage in layout for asset in stage])
+
+def split_merge(width=10, buffer_capacity=5):
+    """A machine that distributes parts among parallel buffers, a station of machines
+    that each take from one of the buffers and place parts in one of a second set of
+    buffers, and a machine that takes parts from all of the second buffers.
+    """
+    source = Source()
+    split = Machine('split', cycle_time=1)
+    first = [Buffer(f'B1_{b}', capacity=buffer_capacity) for b in range(width)]
+    station = [Machine(f'M{m}', cycle_time=width) for m in range(width)]
+    second = [Buffer(f'B2_{b}', capacity=buffer_capacity) for b in range(width)]
+    merge = Machine('merge', cycle_time=1)
+    sink = Sink()
+
+    source.define_routing(downstream=[split])
+    split.define_routing(upstream=[source], downstream=first)
+    for buffer1, machine, buffer2 in zip(first, station, second):
+        buffer1.define_routing(upstream=[split], downstream=[machine])
+        machine.define_routing(upstream=[buffer1], downstream=[buffer2])
+        buffer2.define_routing(upstream=[machine], downstream=[merge])
+    merge.define_routing(upstream=second, downstream=[sink])
+    sink.define_routing(upstream=[merge])
+
+    return System([source, split] + first + station + second + [merge, sink])
+
+def cbm_line(machines=10, capacity=2):
+    """A serial line under condition-based maintenance with a maintainer that can
+    service only a few machines at a time.
+    """
+    return serial_line(machines, cbm_threshold=3, capacity=capacity)
+
+def measure_simulation(system, simulation_time, memory=True):
+    start = time.perf_counter()
+    system.simulate(simulation_time=simulation_time, verbose=False, seed=0)
+    wall_time = time.perf_counter() - start
+    events = system.env.event_index
+
+    result = {
+        'wall_time': wall_time,
+        'events': events,
+        'events_per_second': events / wall_time,
+        'parts_produced': sum([sink.level for sink in system.sinks])
+    }
+
+    if memory:
+        # Memory is measured in a separate run since tracing allocations is slow
+        tracemalloc.start()
+        system.simulate(simulation_time=simulation_time, verbose=False, seed=0)
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+def measure_replications(system, replications, simulation_time, jobs):
+    start = time.perf_counter()
+    system.iterate_simulation(
+        replications, simulation_time=simulation_time, verbose=False, jobs=jobs
+    )
+    wall_time = time.perf_counter() - start
+    return {
+        'wall_time': wall_time,
+        'replications': replications,
+        'replications_per_second': replications / wall_time
+    }
+
+def get_benchmarks(scale=1):
+    """Returns the benchmarks to run as (name, parameters, function) tuples."""
+    simulation_time = scale * utils.DAY
+    benchmarks = []
+    for machines in [5, 20, 50]:
+        benchmarks.append((
+            f'serial_line_{machines}',
+            {'machines': machines, 'simulation_time': simulation_time},
+            lambda machines=machines: measure_simulation(
+                serial_line(machines), simulation_time
+            )
+        ))
+    for width in [2, 10, 25]:
+        benchmarks.append((
+            f'parallel_stations_{width}',
+            {'width': width, 'simulation_time': simulation_time},
+            lambda width=width: measure_simulation(
+                parallel_stations(width), simulation_time
+            )
+        ))
+    for width in [10, 50]:
+        benchmarks.append((
+            f'split_merge_{width}',
+            {'width': width, 'simulation_time': simulation_time},
+            lambda width=width: measure_simulation(split_merge(width), simulation_time)
+        ))
+    for capacity in [1, 3]:
+        benchmarks.append((
+            f'cbm_line_capacity_{capacity}',
+            {'machines': 20, 'capacity': capacity, 'simulation_time': simulation_time},
+            lambda capacity=capacity: measure_simulation(
+                cbm_line(20, capacity), simulation_time
+            )
+        ))
+    for jobs in sorted({1, multiprocessing.cpu_count()}):
+        benchmarks.append((
+            f'replications_jobs_{jobs}',
+            {
+                'machines': 5,
+                'replications': 20,
+                'jobs': jobs,
+                'simulation_time': simulation_time
+            },
+            lambda jobs=jobs: measure_replications(
+                serial_line(5), 20, simulation_time, jobs
+            )
+        ))
+    return benchmarks
+
+def compare(results, baseline):
+    """Print the change in throughput of each benchmark relative to a baseline."""
+    baseline = {result['name']: result for result in baseline['results']}
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous is None:
+            continue
+        for metric in ['events_per_second', 'replications_per_second']:
+            if metric in result and metric in previous:
+                change = result[metric] / previous[metric] - 1
+                print(f'{result["name"]:<28}{metric:<26}{change:>+8.1%}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='file to save results to as JSON')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    parser.add_argument(
+        '--scale',
+        type=float,
+        default=1,
+        help='simulation time of each benchmark in days'
+    )
+    parser.add_argument(
+        '--filter', default='', help='only run benchmarks containing this string'
+    )
+    args = parser.parse_args()
+
+    results = []
+    for name, parameters, benchmark in get_benchmarks(args.scale):
+        if args.filter not in name:
+            continue
+        result = {'name': name, 'parameters': parameters}
+        result.update(benchmark())
+        results.append(result)
+
+        line = f'{name:<28}{result["wall_time"]:>8.2f}s'
+        if 'events_per_second' in result:
+            line += f'{result["events_per_second"]:>12.0f} events/s'
+            line += f'{result["peak_memory"]/2**20:>10.1f} MiB'
+        else:
+            line += f'{result["replications_per_second"]:>12.2f} reps/s'
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(
+                {
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': sys.version,
+                    'numpy': np.__version__,
+                    'platform': platform.platform(),
+                    'results': results
+                },
+                output,
+                indent=2
+            )
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+if __name__ == '__main__':
+    main()
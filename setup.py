@@ -13,6 +13,7 @@ setuptools.setup(
     long_description_content_type='text/markdown',
     url='https://github.com/m-hoff/maintsim',
     packages=setuptools.find_packages(),
+    install_requires=['numpy'],
     classifiers=[
         'Programming Language :: Python :: 3',
         'Intended Audience :: Manufacturing',
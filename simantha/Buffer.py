@@ -1,3 +1,5 @@
+from .data import DataColumn, TimeWeightedStatistic
+
 class Buffer:
     def __init__(self, name='Buffer', capacity=float('inf'), initial_level=0):
         self.name = name
@@ -7,52 +9,123 @@ class Buffer:
 
         self.env = None
 
-        self.level_data = {'time': [0], 'level': [initial_level]}
+        self.level_data = {
+            'time': DataColumn([0]), 'level': DataColumn([initial_level], widen=False)
+        }
 
         self.pending_requests = []
 
+        # Machines waiting for space in or parts from this buffer, used as ordered sets
+        self.waiting_producers = {}
+        self.waiting_consumers = {}
+
+        # Machines that track whether this buffer can give or receive a part, set by
+        # the system when its routing is compiled
+        self.tracking_consumers = []
+        self.tracking_producers = []
+        self.giving = None
+        self.receiving = None
+
+        self.statistics = {}
+
     def initialize(self):
         self.level = self.initial_level
         
         self.reserved_content = 0
         self.reserved_vacancy = 0
 
+        self.giving = None
+        self.receiving = None
+        self.update_giving()
+        self.update_receiving()
+
+        # Machines downstream start out waiting for parts
+        self.waiting_producers = {}
+        self.waiting_consumers = dict.fromkeys(
+            asset for asset in self.downstream if hasattr(asset, 'request_part')
+        )
+
         if self.env.collect_data:
-            self.level_data = {'time': [0], 'level': [self.initial_level]}
+            self.level_data = {
+                'time': DataColumn([0]), 'level': DataColumn([self.initial_level], widen=False)
+            }
+
+        if self.env.collect_statistics:
+            self.statistics = {
+                'level': TimeWeightedStatistic(self.level, 0, self.env.warm_up_time)
+            }
+        else:
+            self.statistics = {}
 
     def can_get_part(self):
         return self.level + self.reserved_vacancy < self.capacity
 
     def reserve_content(self, quantity=1):
         self.reserved_content += 1
-        
+        if self.tracking_consumers:
+            self.update_giving()
+
     def get(self, quantity=1):
         if not self.is_empty():
             self.level -= quantity
             self.reserved_content -= quantity
+            if self.tracking_producers:
+                self.update_receiving()
 
             if self.env.collect_data:
                 self.level_data['time'].append(self.env.now)
                 self.level_data['level'].append(self.level)
 
+            if self.env.collect_statistics:
+                self.statistics['level'].update(self.env.now, self.level)
+
         else:
             raise RuntimeError('Attempting to take more parts than available.')
 
     def reserve_vacancy(self, quantity=1):
         self.reserved_vacancy += 1
+        if self.tracking_producers:
+            self.update_receiving()
             
     def put(self, quantity=1):
         if not self.is_full():
             self.level += quantity
             self.reserved_vacancy -= 1
+            if self.tracking_consumers:
+                self.update_giving()
 
             if self.env.collect_data:
                 self.level_data['time'].append(self.env.now)
                 self.level_data['level'].append(self.level)
 
+            if self.env.collect_statistics:
+                self.statistics['level'].update(self.env.now, self.level)
+
         else:
             raise RuntimeError('Attempting to put part in full buffer.')
     
+    def update_giving(self):
+        # Update the machines tracking whether this buffer can give a part
+        giving = self.can_give()
+        if giving != self.giving:
+            self.giving = giving
+            for consumer in self.tracking_consumers:
+                if giving:
+                    consumer.available_givers[self] = None
+                else:
+                    consumer.available_givers.pop(self, None)
+
+    def update_receiving(self):
+        # Update the machines tracking whether this buffer can receive a part
+        receiving = self.can_receive()
+        if receiving != self.receiving:
+            self.receiving = receiving
+            for producer in self.tracking_producers:
+                if receiving:
+                    producer.available_receivers[self] = None
+                else:
+                    producer.available_receivers.pop(self, None)
+
     def is_empty(self):
         #return self.level - self.reserved_content == 0
         return self.level == 0
@@ -64,6 +137,12 @@ class Buffer:
     def can_give(self):
         return self.level - self.reserved_content > 0
 
+    def get_available_content(self):
+        return self.level - self.reserved_content
+
+    def get_available_vacancy(self):
+        return self.capacity - self.level - self.reserved_vacancy
+
     def can_receive(self):
         return self.level + self.reserved_vacancy < self.capacity
 
@@ -1,11 +1,17 @@
-import random
 import time
 import warnings
 
 from .Asset import Asset
+from .data import *
 from .simulation import *
 
 class Machine(Asset):
+    # Maintenance events recorded in maintenance_data
+    maintenance_events = [
+        'enter queue', 'failure', 'begin maintenance', 'planned failure', 'repaired'
+    ]
+    operating_states = ['busy', 'blocked', 'starved', 'down']
+
     def __init__(
         self,
         name=None,
@@ -21,7 +27,10 @@ class Machine(Asset):
         
         # Initial machine state
         initial_health=0,
-        initial_remaining_process=None
+        initial_remaining_process=None,
+
+        # Execute zero-delay part transfer steps inline when uncontended
+        fuse_transfers=False
     ):
         # User-specified parameters
         self.name = name
@@ -34,6 +43,7 @@ class Machine(Asset):
             self.initial_remaining_process = self.get_cycle_time()
         self.remaining_process_time = self.initial_remaining_process
         self.selection_priority = selection_priority
+        self.fuse_transfers = fuse_transfers
         
         # Initial machine state
         self.has_finished_part = False
@@ -41,13 +51,18 @@ class Machine(Asset):
         self.health = initial_health
         self.degradation_matrix = degradation_matrix
         self.failed_health = len(degradation_matrix) - 1
+        self.degradation_sojourns = self.get_degradation_sojourns()
         self.cbm_threshold = cbm_threshold or self.failed_health # if not specified, CM is used
         if self.health == self.failed_health:
             self.failed = True
         else:
             self.failed = False
         self.assigned_maintenance = False
+        # Maintainers that can service this machine, and the maintainer currently
+        # servicing it, if any
+        self.maintainers = []
         self.maintainer = None
+        self.assigned_maintainer = None
         self.has_reserved_part = False
 
         self.pm_distribution = Distribution(pm_distribution)
@@ -64,6 +79,14 @@ class Machine(Asset):
         # Routing
         self.upstream = []
         self.downstream = []
+        # Routing used during simulation, compiled by the system before each run
+        self.givers = ()
+        self.receivers = ()
+        # Givers and receivers that can currently give or receive a part, used as
+        # ordered sets and kept up to date by the containers themselves, or None if
+        # their availability is not tracked
+        self.available_givers = None
+        self.available_receivers = None
         
         # Machine status
         self.has_part = False
@@ -74,15 +97,35 @@ class Machine(Asset):
         # Machine statistics
         self.parts_made = 0
         self.downtime = 0
+        self.state = 'starved'
+        self.state_start = 0
+        self.state_times = dict.fromkeys(self.operating_states, 0)
 
         # Simulation data
-        self.production_data = {'time': [0], 'production': [0]}
-        self.health_data = {'time': [0], 'health': [self.health]}
-        self.maintenance_data = {'time': [], 'event': []}
+        self.production_data = {
+            'time': DataColumn([0]), 'production': DataColumn([0], widen=False)
+        }
+        self.health_data = {
+            'time': DataColumn([0]), 'health': DataColumn([self.health], widen=False)
+        }
+        self.maintenance_data = {
+            'time': DataColumn(),
+            'event': CategoricalColumn(categories=self.maintenance_events)
+        }
+        self.statistics = {}
         
         self.env = None
 
     def initialize(self):
+        # Random samples are drawn from the environment's generator
+        distributions = (
+            [self.cycle_time, self.pm_distribution, self.cm_distribution]
+            + self.degradation_sojourns
+        )
+        for distribution in distributions:
+            if isinstance(distribution, Distribution):
+                distribution.initialize(self.env.generator)
+
         self.remaining_process_time = self.initial_remaining_process
         self.health = self.initial_health
         if self.health == self.failed_health:
@@ -95,6 +138,7 @@ class Machine(Asset):
         self.under_repair = False
         self.in_queue = False
         self.remaining_ttr = None
+        self.assigned_maintainer = None
 
         self.target_giver = None
         self.target_receiver = None
@@ -109,6 +153,23 @@ class Machine(Asset):
         self.parts_made = 0
         self.downtime = 0
 
+        # Time spent busy, blocked, starved, and down after the warm up period
+        self.state = 'down' if self.failed else 'starved'
+        self.state_start = 0
+        self.state_times = dict.fromkeys(self.operating_states, 0)
+
+        if self.env.collect_statistics:
+            start = self.env.warm_up_time
+            self.statistics = {
+                'availability': TimeWeightedStatistic(int(not self.failed), 0, start),
+                'utilization': TimeWeightedStatistic(0, 0, start),
+                'health': TimeWeightedStatistic(self.health, 0, start),
+                'health_states': TimeInStateStatistic(self.health, 0, start),
+                'throughput': RateStatistic(start)
+            }
+        else:
+            self.statistics = {}
+
         # Schedule planned failures
         if self.planned_failure is not None:
             self.env.schedule_event(
@@ -117,14 +178,21 @@ class Machine(Asset):
 
         # Initialize data
         if self.env.collect_data:
-            self.production_data = {'time': [0], 'production': [0]}
-            self.health_data = {'time': [0], 'health': [self.health]}
-            self.maintenance_data = {'time': [], 'event': []}
+            self.production_data = {
+                'time': DataColumn([0]), 'production': DataColumn([0], widen=False)
+            }
+            self.health_data = {
+                'time': DataColumn([0]), 'health': DataColumn([self.health], widen=False)
+            }
+            self.maintenance_data = {
+                'time': DataColumn(),
+                'event': CategoricalColumn(categories=self.maintenance_events)
+            }
 
         # Schedule initial events
         time_to_degrade = self.get_time_to_degrade()
         self.env.schedule_event(
-            time_to_degrade, self, self.degrade, f'{self.name}.initialize'
+            time_to_degrade, self, self.degrade, (self.name, 'initialize')
         )
 
         self.initialize_addon_processes()
@@ -141,34 +209,48 @@ class Machine(Asset):
         self.target_giver.get(1)
 
         self.has_part = True
+        self.set_state('busy')
+
+        if self.env.collect_statistics:
+            self.statistics['utilization'].update(self.env.now, 1)
 
         self.env.schedule_event(
             self.env.now+self.get_cycle_time(),
             self, 
             self.request_space, 
-            f'{self.name}.get_part at {self.env.now}'
+            (self.name, 'get_part', self.env.now)
         )
 
         # check if this event unblocked another machine
-        for asset in self.target_giver.upstream:
-            if asset.can_give() and self.target_giver.can_receive():
-                source = f'{self.name}.get_part at {self.env.now}'
-                self.env.schedule_event(
-                    self.env.now, asset, asset.request_space, source
-                )
+        self.wake_producers(self.target_giver, (self.name, 'get_part', self.env.now))
 
         self.target_giver = None
 
     def request_space(self):
         self.has_finished_part = True
-        candidate_receivers = [obj for obj in self.downstream if obj.can_receive()]
-        if len(candidate_receivers) > 0:
-            self.target_receiver = random.choice(candidate_receivers)
+        if self.env.collect_statistics:
+            self.statistics['utilization'].update(self.env.now, 0)
+
+        receiver = self.select_available(
+            self.receivers, 'can_receive', self.available_receivers
+        )
+        if receiver is not None:
+            if self.blocked:
+                self.stop_waiting_for_space()
+            if len(self.receivers) > 1:
+                # This machine may have been woken to use the space of another receiver
+                source = (self.name, 'request_space', self.env.now)
+                for other in self.receivers:
+                    if other is not receiver:
+                        self.wake_producers(other, source)
+            self.target_receiver = receiver
             self.target_receiver.reserve_vacancy(1)
-            source = f'{self.name}.request_space at {self.env.now}'
-            self.env.schedule_event(self.env.now, self, self.put_part, source)
+            source = (self.name, 'request_space', self.env.now)
+            self.schedule_transfer(self.put_part, source)
         else:
             self.blocked = True
+            self.set_state('blocked')
+            self.wait_for_space()
             
     def put_part(self):
         assert self.target_receiver is not None, f'No receiver identified for {self.name}'
@@ -179,41 +261,170 @@ class Machine(Asset):
             self.parts_made += 1
         self.has_finished_part = False
         self.has_part = False
+        self.blocked = False
+        self.set_state('starved')
 
         if self.env.now > self.env.warm_up_time and self.env.collect_data:
             self.production_data['time'].append(self.env.now)
             self.production_data['production'].append(self.parts_made)        
 
-        source = f'{self.name}.put_part at {self.env.now}'
-        self.env.schedule_event(self.env.now, self, self.request_part, source)
+        if self.env.collect_statistics:
+            self.statistics['throughput'].increment(self.env.now)
 
         # Check if this event fed another machine
-        for asset in self.target_receiver.downstream:
-            if self.target_receiver.can_give() and asset.can_receive() and not asset.has_content_request():
-                source = f'{self.name}.put_part at {self.env.now}'
-                self.env.schedule_event(self.env.now, asset, asset.request_part, source)
-        
+        self.wake_consumers(self.target_receiver, (self.name, 'put_part', self.env.now))
+
         self.target_receiver = None
 
+        source = (self.name, 'put_part', self.env.now)
+        self.schedule_transfer(self.request_part, source)
+
     def request_part(self):
-        candidate_givers = [obj for obj in self.upstream if obj.can_give()]
-        if len(candidate_givers) > 0:
+        giver = self.select_available(self.givers, 'can_give', self.available_givers)
+        if giver is not None:
+            if self.starved:
+                self.stop_waiting_for_part()
+            if len(self.givers) > 1:
+                # This machine may have been woken to take the part of another giver
+                source = (self.name, 'request_part', self.env.now)
+                for other in self.givers:
+                    if other is not giver:
+                        self.wake_consumers(other, source)
             self.starved = False
-            self.target_giver = random.choice(candidate_givers)
+            self.target_giver = giver
             self.target_giver.reserve_content(1)
-            source = f'{self.name}.request_part at {self.env.now}'
-            self.env.schedule_event(self.env.now, self, self.get_part, source)
+            source = (self.name, 'request_part', self.env.now)
+            self.schedule_transfer(self.get_part, source)
         else:
             self.starved = True
+            self.set_state('starved')
+            self.wait_for_part()
+
+    def wait_for_space(self):
+        # Wait to be woken when a downstream asset has space for the finished part
+        for receiver in self.receivers:
+            receiver.waiting_producers[self] = None
+
+    def stop_waiting_for_space(self):
+        for receiver in self.receivers:
+            receiver.waiting_producers.pop(self, None)
+
+    def wait_for_part(self):
+        # Wait to be woken when an upstream asset has a part available
+        for giver in self.givers:
+            giver.waiting_consumers[self] = None
+
+    def stop_waiting_for_part(self):
+        for giver in self.givers:
+            giver.waiting_consumers.pop(self, None)
+
+    def wake_producers(self, container, source):
+        # Space became available in the container, so machines waiting to place a part
+        # in it request space again. Only as many machines as there are vacancies are
+        # woken, chosen at random. Machines that can no longer give a part, e.g.,
+        # because they failed, stop waiting and will request space after repair.
+        waiting = container.waiting_producers
+        if not waiting or not container.can_receive():
+            return
+        self.wake_waiting(
+            waiting,
+            container.get_available_vacancy(),
+            lambda producer: producer.stop_waiting_for_space(),
+            lambda producer: (
+                producer.can_give() and not producer.has_vacancy_request()
+            ),
+            'request_space',
+            source
+        )
+
+    def wake_consumers(self, container, source):
+        # A part became available in the container, so machines waiting for a part
+        # request one. Only as many machines as there are available parts are woken,
+        # chosen at random. Machines that cannot receive a part or have already
+        # requested one stop waiting.
+        waiting = container.waiting_consumers
+        if not waiting or not container.can_give():
+            return
+        self.wake_waiting(
+            waiting,
+            container.get_available_content(),
+            lambda consumer: consumer.stop_waiting_for_part(),
+            lambda consumer: (
+                consumer.can_receive() and not consumer.has_content_request()
+            ),
+            'request_part',
+            source
+        )
+
+    def wake_waiting(self, waiting, available, stop_waiting, can_wake, action, source):
+        machines = list(waiting)
+        if available >= len(machines):
+            # Every waiting machine can be woken, in any order since simultaneous
+            # requests are executed in random order
+            for machine in machines:
+                stop_waiting(machine)
+                if can_wake(machine):
+                    self.env.schedule_event(
+                        self.env.now, machine, getattr(machine, action), source
+                    )
+            return
+
+        woken = 0
+        while machines and woken < available:
+            i = self.env.random.randrange(len(machines))
+            machine = machines[i]
+            machines[i] = machines[-1]
+            machines.pop()
+
+            stop_waiting(machine)
+            if can_wake(machine):
+                self.env.schedule_event(
+                    self.env.now, machine, getattr(machine, action), source
+                )
+                woken += 1
+
+    def select_available(self, assets, condition, available=None):
+        # Choose an asset at random from those for which the "condition" method returns
+        # True, or return None if there are none. Most machines have a single asset
+        # upstream and downstream, which is checked directly without a random draw. If
+        # the assets track their own availability, "available" holds those that meet
+        # the condition and none of them need to be checked.
+        if len(assets) == 1:
+            asset = assets[0]
+            return asset if getattr(asset, condition)() else None
+
+        if available is None:
+            available = [asset for asset in assets if getattr(asset, condition)()]
+        if not available:
+            return None
+        elif len(available) == 1:
+            return next(iter(available))
+        return list(available)[self.env.random.randrange(len(available))]
+
+    def schedule_transfer(self, action, source):
+        # Schedule the next zero-delay step of a part transfer. If transfers are fused
+        # and no other pending event would be executed before this step, the step is
+        # executed immediately instead, which results in the same sample path. This
+        # should be the last event scheduled by the calling action.
+        if self.fuse_transfers:
+            self.env.execute_or_schedule(self, action, source)
+        else:
+            self.env.schedule_event(self.env.now, self, action, source)
 
     def degrade(self):
-        source = f'{self.name}.degrade at {self.env.now}'
+        source = (self.name, 'degrade', self.env.now)
         self.health += 1
+        if self.in_queue:
+            for maintainer in self.maintainers:
+                maintainer.update_queue(self)
 
         if self.env.collect_data:
             self.health_data['time'].append(self.env.now)
             self.health_data['health'].append(self.health)
 
+        if self.env.collect_statistics:
+            self.update_health_statistics()
+
         time_to_degrade = self.get_time_to_degrade()
         if self.health == self.failed_health:
             self.env.schedule_event(self.env.now, self, self.fail, source)
@@ -235,49 +446,66 @@ class Machine(Asset):
 
             self.time_entered_queue = self.env.now
             self.in_queue = True
+            for maintainer in self.maintainers:
+                maintainer.enqueue(self)
 
-        if not self.failed and self.maintainer.is_available():
-            source = f'{self.name}.enter_queue at {self.env.now}'
-            self.env.schedule_event(
-                self.env.now, self.maintainer, self.maintainer.inspect, source
-            )
+        if not self.failed:
+            source = (self.name, 'enter_queue', self.env.now)
+            for maintainer in self.maintainers:
+                if maintainer.is_available():
+                    self.env.schedule_event(
+                        self.env.now, maintainer, maintainer.inspect, source
+                    )
 
     def fail(self):
         self.failed = True
         self.downtime_start = self.env.now
+        self.set_state('down')
 
         if not self.in_queue:
             self.enter_queue()
+        else:
+            for maintainer in self.maintainers:
+                maintainer.update_queue(self)
 
         if self.env.collect_data:
             self.maintenance_data['time'].append(self.env.now)
             self.maintenance_data['event'].append('failure')
 
+        if self.env.collect_statistics:
+            self.update_availability_statistics()
+
         self.cancel_all_events()
 
-        if self.maintainer.is_available():
-            source = f'{self.name}.fail at {self.env.now}'
-            self.env.schedule_event(
-                self.env.now, self.maintainer, self.maintainer.inspect, source
-            )
+        source = (self.name, 'fail', self.env.now)
+        for maintainer in self.maintainers:
+            if maintainer.is_available():
+                self.env.schedule_event(
+                    self.env.now, maintainer, maintainer.inspect, source
+                )
 
     def get_cycle_time(self):
         return self.cycle_time.sample() 
 
     def get_time_to_degrade(self):
-        if 1 in self.degradation_matrix[self.health]:
+        sojourn = self.degradation_sojourns[self.health]
+        if sojourn is None:
             return float('inf')
-
-        ttd = 0
-        next_health = self.health
-        while next_health == self.health:
-            ttd += 1
-            next_health = random.choices(
-                population=range(self.failed_health+1),
-                weights=self.degradation_matrix[self.health],
-                k=1
-            )[0]
-        return ttd
+        return sojourn.sample()
+
+    def get_degradation_sojourns(self):
+        # The number of time steps spent in each health state is geometrically
+        # distributed with the probability of leaving that state as its parameter. These
+        # distributions are constructed once so that sampling the time to degrade only
+        # requires a single random number.
+        sojourns = []
+        for health, transitions in enumerate(self.degradation_matrix):
+            exit_probability = 1 - transitions[health] / sum(transitions)
+            if (1 in transitions) or (exit_probability <= 0):
+                sojourns.append(None)
+            else:
+                sojourns.append(Distribution({'geometric': exit_probability}))
+        return sojourns
     
     def maintain(self):
         if not self.failed:
@@ -285,32 +513,40 @@ class Machine(Asset):
         self.has_part = False
         self.has_finished_part = False
         self.under_repair = True
+        self.set_state('down')
 
         if self.env.collect_data:
             self.maintenance_data['time'].append(self.env.now)
             self.maintenance_data['event'].append('begin maintenance')
+
+        if self.env.collect_statistics:
+            self.update_availability_statistics()
         
         self.in_queue = False 
         time_to_repair = self.get_time_to_repair()
         
         self.cancel_all_events()
         
-        source = f'{self.name}.maintain at {self.env.now}'
+        source = (self.name, 'maintain', self.env.now)
         self.env.schedule_event(self.env.now+time_to_repair, self, self.restore, source)
 
     def maintain_planned_failure(self):
         self.failed = True
         self.downtime_start = self.env.now
         self.under_repair = True
+        self.set_state('down')
 
         if self.env.collect_data:
             self.maintenance_data['time'].append(self.env.now)
             self.maintenance_data['event'].append('planned failure')
+
+        if self.env.collect_statistics:
+            self.update_availability_statistics()
         
         self.cancel_all_events()
         
         time_to_repair = self.planned_failure[1]
-        source = f'{self.name}.maintain_planned_failure at {self.env.now}'
+        source = (self.name, 'maintain_planned_failure', self.env.now)
         self.env.schedule_event(
             self.env.now+time_to_repair, self, self.restore, source
         )
@@ -319,10 +555,16 @@ class Machine(Asset):
         self.health = 0
         self.under_repair = False
         self.failed = False
-        
-        self.maintainer.utilization -= 1
+
+        # Release the maintainer that serviced the machine. Planned failures are not
+        # serviced by a maintainer.
+        maintainer = self.assigned_maintainer
+        self.assigned_maintainer = None
+        if maintainer is not None:
+            maintainer.utilization -= 1
 
         self.downtime += (self.env.now - self.downtime_start)
+        self.set_state('starved')
 
         if self.env.collect_data:
             self.maintenance_data['time'].append(self.env.now)
@@ -331,7 +573,15 @@ class Machine(Asset):
             self.health_data['time'].append(self.env.now)
             self.health_data['health'].append(self.health)  
 
-        source = f'{self.name}.restore at {self.env.now}'
+        if self.env.collect_statistics:
+            self.update_availability_statistics()
+            self.update_health_statistics()
+            if maintainer is not None:
+                maintainer.statistics['utilization'].update(
+                    self.env.now, maintainer.utilization
+                )
+
+        source = (self.name, 'restore', self.env.now)
         self.env.schedule_event(self.env.now, self, self.request_part, source)
         time_to_degrade = self.get_time_to_degrade()
         self.env.schedule_event(
@@ -339,15 +589,79 @@ class Machine(Asset):
         )
         
         # Repairman to scan queue once released
-        self.env.schedule_event(
-            self.env.now, self.maintainer, self.maintainer.inspect, source
-        )
+        if maintainer is not None:
+            self.env.schedule_event(
+                self.env.now, maintainer, maintainer.inspect, source
+            )
 
         self.repair_addon_processes()
 
     def repair_addon_processes(self):
         pass
+
+    def set_state(self, state):
+        # Record the time spent in the current operating state and enter "state". A
+        # machine that is failed or under repair is always down, even if a transfer
+        # scheduled before the failure completes.
+        self.update_state_times()
+        if self.failed or self.under_repair:
+            self.state = 'down'
+        else:
+            self.state = state
+
+    def update_state_times(self):
+        # Add the time since the last change of operating state that falls after the
+        # warm up period to the total time spent in the current state
+        now = self.env.now
+        duration = now - max(self.state_start, self.env.warm_up_time)
+        if duration > 0:
+            self.state_times[self.state] += duration
+        self.state_start = now
+
+    @property
+    def busy_time(self):
+        return self.state_times['busy']
+
+    @property
+    def blocked_time(self):
+        return self.state_times['blocked']
+
+    @property
+    def starved_time(self):
+        return self.state_times['starved']
+
+    @property
+    def down_time(self):
+        return self.state_times['down']
+
+    def update_availability_statistics(self):
+        # Called whenever the machine goes down or is restored. A machine that is down
+        # is not processing a part.
+        available = int(not (self.failed or self.under_repair))
+        self.statistics['availability'].update(self.env.now, available)
+        if not available:
+            self.statistics['utilization'].update(self.env.now, 0)
+
+    def update_health_statistics(self):
+        self.statistics['health'].update(self.env.now, self.health)
+        self.statistics['health_states'].update(self.env.now, self.health)
     
+    def can_request_maintenance(self):
+        """Returns True if the machine can reach a health state at which it requests
+        preventive or corrective maintenance.
+        """
+        reachable = {self.initial_health}
+        frontier = [self.initial_health]
+        while frontier:
+            health = frontier.pop()
+            if health >= self.cbm_threshold:
+                return True
+            for next_health, probability in enumerate(self.degradation_matrix[health]):
+                if probability > 0 and next_health not in reachable:
+                    reachable.add(next_health)
+                    frontier.append(next_health)
+        return False
+
     def requesting_maintenance(self):
         return (
             (not self.under_repair)
@@ -364,6 +678,27 @@ class Machine(Asset):
     def define_routing(self, upstream=[], downstream=[]):
         self.upstream = upstream
         self.downstream = downstream
+        self.compile_routing()
+
+    def compile_routing(self):
+        self.givers = tuple(self.upstream)
+        self.receivers = tuple(self.downstream)
+
+        # The availability of several containers is tracked as they change rather than
+        # checked each time a part is transferred. Machines cannot track their own
+        # availability, so neighbouring machines are always checked directly.
+        if len(self.givers) > 1 and all(
+            hasattr(giver, 'tracking_consumers') for giver in self.givers
+        ):
+            self.available_givers = {}
+        else:
+            self.available_givers = None
+        if len(self.receivers) > 1 and all(
+            hasattr(receiver, 'tracking_producers') for receiver in self.receivers
+        ):
+            self.available_receivers = {}
+        else:
+            self.available_receivers = None
 
     def can_receive(self):
         return (
@@ -384,25 +719,28 @@ class Machine(Asset):
 
     def has_content_request(self):
         # Check if a machine has an existing request for a part
-        for event in self.env.events:
-            if (
-                ((event.location is self) and (event.action.__name__ == 'request_part'))
-                or ((event.location is self) and (event.action.__name__ == 'get_part'))
-            ):
-                return True
-        return False
+        return (
+            self.env.has_pending(self, 'request_part')
+            or self.env.has_pending(self, 'get_part')
+        )
 
     def has_vacancy_request(self):
-        for event in self.env.events:
-            if (event.location is self) and (event.action.__name__ == 'request_space'):
-                return True
-        return False
+        return self.env.has_pending(self, 'request_space')
 
     def cancel_all_events(self):
         # Cancel all events scheduled on this machine
-        for event in self.env.events:
-            if event.location == self:
-                event.canceled = True
+        requesting_part = self.env.has_pending(self, 'request_part')
+        requesting_space = self.env.has_pending(self, 'request_space')
+        self.env.cancel_events(self)
+
+        # This machine may have been woken in place of other waiting machines
+        source = (self.name, 'cancel_all_events', self.env.now)
+        if requesting_part:
+            for giver in self.givers:
+                self.wake_consumers(giver, source)
+        if requesting_space:
+            for receiver in self.receivers:
+                self.wake_producers(receiver, source)
 
     def get_candidate_givers(self, only_free=False, blocked=False):
         if blocked:
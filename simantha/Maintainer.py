@@ -1,43 +1,197 @@
-import random 
+import heapq
+import itertools
 
+from .data import TimeWeightedStatistic
 from .simulation import *
 
+def expected_repair_time(machine):
+    if machine.failed: # Machine requires corrective maintenance
+        return machine.cm_distribution.mean
+    else: # Machine requires preventive maintenance
+        return machine.pm_distribution.mean
+
+def fifo_key(machine):
+    # First in, first out
+    return machine.time_entered_queue
+
+def lpt_key(machine):
+    # Longest expected processing (repair) time first
+    return -expected_repair_time(machine)
+
+def spt_key(machine):
+    # Shortest expected processing (repair) time first
+    return expected_repair_time(machine)
+
+def health_key(machine):
+    # Worst health first
+    return -machine.health
+
+policies = {'fifo': fifo_key, 'lpt': lpt_key, 'spt': spt_key, 'health': health_key}
+
 class Maintainer:
-    # Basic maintainer, follows FIFO by default
-    def __init__(self, name='repairman', capacity=float('inf')):
+    """Basic maintainer, follows FIFO by default.
+
+    Machines requesting maintenance are kept in a priority queue ordered by the key
+    returned by `policy_key`, so choosing the next machine to maintain does not require
+    scanning every machine in the system. Machines with the lowest key are maintained
+    first, ties are broken by the time machines entered the queue and then randomly.
+
+    The policy may be one of the built-in policies 'fifo', 'lpt' (longest expected
+    repair time first), 'spt' (shortest expected repair time first), and 'health'
+    (worst health first), or a function that returns the key of a machine. Subclasses
+    may instead override `policy_key`, or override `choose_maintenance_action` for
+    policies that cannot be expressed as a key, in which case it is called with the
+    list of queued machines returned by `get_queue`.
+
+    A system may have several maintainers, such as separate crews for different types
+    of equipment. Each maintainer has its own queue and capacity, and only services the
+    specified `machines`, or every machine in the system if none are specified. A
+    machine that can be serviced by several maintainers is queued with each of them and
+    is maintained by whichever maintainer chooses it first.
+    """
+    def __init__(
+        self, name='repairman', capacity=float('inf'), policy='fifo', machines=None
+    ):
         self.name = name
         self.capacity = capacity
+        self.machines = machines
+        if callable(policy):
+            self.policy = policy
+        elif policy in policies:
+            self.policy = policies[policy]
+        else:
+            raise ValueError(
+                f'Invalid policy {policy}. Policy should be a function or one of '
+                + ', '.join(policies)
+            )
 
         self.utilization = 0
 
         self.env = None
         self.system = None
 
+        self.statistics = {}
+        self.custom_policy = self.has_custom_policy()
+        self.reset_queue()
+
     def initialize(self):
         self.utilization = 0
+        self.custom_policy = self.has_custom_policy()
+        self.reset_queue()
+
+        if self.env.collect_statistics:
+            self.statistics = {
+                'utilization': TimeWeightedStatistic(0, 0, self.env.warm_up_time)
+            }
+        else:
+            self.statistics = {}
+
+    def reset_queue(self):
+        # Queued machines, in the order they entered the queue, mapped to their current
+        # heap entry. Heap entries are (key, time entered queue, tiebreak, sequence,
+        # machine) tuples. Entries of machines that have since left the queue or been
+        # given a new key are skipped when they reach the top of the heap. The heap is
+        # not used by maintainers with a custom policy.
+        self.queue = {}
+        self.queue_heap = []
+        self.queue_sequence = itertools.count()
+
+    def can_maintain(self, machine):
+        """Returns True if the machine is serviced by this maintainer."""
+        return self.machines is None or machine in self.machines
 
     def is_available(self):
         return self.utilization < self.capacity
 
     def inspect(self):
         # if available, check for machines requesting repair
-        current_queue = self.get_queue()
-        if (not self.is_available()) or (len(current_queue) == 0):
+        if (not self.is_available()) or (len(self.queue) == 0):
             # No available capacity and/or empty queue
             return
-        else:
+        elif self.custom_policy:
+            current_queue = self.get_queue()
+            if len(current_queue) == 0:
+                return
             machine = self.choose_maintenance_action(current_queue)
-            self.utilization += 1
-            machine.in_queue = False
-            machine.under_repair = True
-            source = f'{self.name}.inspect at {self.env.now}'
-            self.env.schedule_event(self.env.now, machine, machine.maintain, source)
+        else:
+            machine = self.get_next_in_queue()
+            if machine is None:
+                return
+
+        # The machine is also removed from the queues of other maintainers
+        self.dequeue(machine)
+        for maintainer in machine.maintainers:
+            maintainer.dequeue(machine)
+        machine.assigned_maintainer = self
+        self.utilization += 1
+        if self.env.collect_statistics:
+            self.statistics['utilization'].update(self.env.now, self.utilization)
+        machine.in_queue = False
+        machine.under_repair = True
+        source = (self.name, 'inspect', self.env.now)
+        self.env.schedule_event(self.env.now, machine, machine.maintain, source)
+
+    def has_custom_policy(self):
+        return (
+            type(self).choose_maintenance_action
+            is not Maintainer.choose_maintenance_action
+            or type(self).get_queue is not Maintainer.get_queue
+        )
 
     def choose_maintenance_action(self, queue):
         # default fifo policy, break ties randomly
         earliest_request = min(m.time_entered_queue for m in queue)
         candidates = [m for m in queue if m.time_entered_queue == earliest_request]
-        return random.choice(candidates)
+        return self.env.random.choice(candidates)
+
+    def policy_key(self, machine):
+        """Returns the priority of a queued machine. Machines with the lowest key are
+        maintained first.
+        """
+        return self.policy(machine)
+
+    def enqueue(self, machine):
+        """Add a machine that has entered the maintenance queue."""
+        entry = (
+            self.policy_key(machine),
+            machine.time_entered_queue,
+            self.env.random.random(),
+            next(self.queue_sequence),
+            machine
+        )
+        self.queue[machine] = entry
+        if not self.custom_policy:
+            heapq.heappush(self.queue_heap, entry)
+
+    def update_queue(self, machine):
+        """Update the key of a queued machine whose condition has changed, such as by
+        degrading or failing.
+        """
+        entry = self.queue.get(machine)
+        if entry is None or self.custom_policy:
+            return
+        key = self.policy_key(machine)
+        if key != entry[0]:
+            entry = (key, entry[1], entry[2], next(self.queue_sequence), machine)
+            self.queue[machine] = entry
+            heapq.heappush(self.queue_heap, entry)
+
+    def dequeue(self, machine):
+        """Remove a machine from the maintenance queue."""
+        self.queue.pop(machine, None)
+
+    def get_next_in_queue(self):
+        """Returns the queued machine with the lowest key without removing it, or None
+        if the queue is empty.
+        """
+        heap = self.queue_heap
+        while heap:
+            machine = heap[0][4]
+            if self.queue.get(machine) is heap[0] and machine.in_queue:
+                return machine
+            heapq.heappop(heap)
+        return None
 
     def get_queue(self):
-        return [machine for machine in self.system.machines if machine.in_queue]
+        """Returns the machines in the maintenance queue in the order they entered it."""
+        return [machine for machine in self.queue if machine.in_queue]
@@ -1,3 +1,5 @@
+from .data import RateStatistic
+
 class Sink:
     def __init__(self, name='Sink', initial_level=0):
         self.name = name
@@ -9,11 +11,32 @@ class Sink:
 
         self.env = None
 
+        self.waiting_producers = {}
+        self.waiting_consumers = {}
+
+        # Machines that track whether this sink can receive a part, set by the system
+        # when its routing is compiled
+        self.tracking_producers = []
+
+        self.statistics = {}
+
         # self.level_data = {'time': [0], 'level': [initial_level]}
 
     def initialize(self):
         self.level = self.initial_level
 
+        self.waiting_producers = {}
+        self.waiting_consumers = {}
+
+        # A sink can always receive a part
+        for producer in self.tracking_producers:
+            producer.available_receivers[self] = None
+
+        if self.env.collect_statistics:
+            self.statistics = {'throughput': RateStatistic(self.env.warm_up_time)}
+        else:
+            self.statistics = {}
+
     def reserve_vacancy(self, quantity=1):
         return
 
@@ -21,6 +44,9 @@ class Sink:
         if self.env.now > self.env.warm_up_time:
             self.level += quantity
 
+        if self.env.collect_statistics:
+            self.statistics['throughput'].increment(self.env.now, quantity)
+
         # self.level_data['time'].append(self.env.now)
         # self.level_data['level'].append(self.level)
 
@@ -33,3 +59,6 @@ class Sink:
 
     def can_receive(self):
         return True
+
+    def get_available_vacancy(self):
+        return float('inf')
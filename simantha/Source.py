@@ -17,6 +17,13 @@ class Source:
 
         self.define_routing()
 
+        self.waiting_producers = {}
+        self.waiting_consumers = {}
+
+        # Machines that track whether this source can give a part, set by the system
+        # when its routing is compiled
+        self.tracking_consumers = []
+
         self.env = None
 
     def initialize(self):
@@ -24,6 +31,13 @@ class Source:
         # currently it's assumed that no machine pulling from a source is starved
         self.reserved_content = 0
 
+        self.waiting_producers = {}
+        self.waiting_consumers = {}
+
+        # A source can always give a part
+        for consumer in self.tracking_consumers:
+            consumer.available_givers[self] = None
+
         for receiver in self.downstream:
             if receiver.can_receive():
                 receiver.starved = False
@@ -31,7 +45,7 @@ class Source:
                     self.env.now, 
                     receiver, 
                     receiver.request_part,
-                    f'{self.name}.arrival at {self.env.now}'
+                    (self.name, 'arrival', self.env.now)
                 )
         
     def generate_arrival(self):
@@ -67,6 +81,9 @@ class Source:
         # TODO: this assumes receivers are never starved
         return True
 
+    def get_available_content(self):
+        return float('inf')
+
     def get_candidate_givers(self, only_free=False, blocked=False):
         return self.upstream
 
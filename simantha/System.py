@@ -1,15 +1,16 @@
-import copy
 import multiprocessing
-import random
 import time
 import warnings
 
+import numpy as np
+
 from .simulation import Environment
 from .Source import Source
 from .Sink import Sink
 from .Machine import Machine
 from .Buffer import Buffer
 from .Maintainer import Maintainer
+from .SystemState import SystemState
 
 class System:
     def __init__(
@@ -32,7 +33,15 @@ class System:
                 self.buffers.append(obj)
             elif type(obj) == Sink:
                 self.sinks.append(obj)
-        self.maintainer = maintainer
+        # Several maintainers may be given as a list. The first maintainer is also
+        # available as "maintainer" for systems with a single maintainer.
+        if isinstance(maintainer, Maintainer):
+            self.maintainers = [maintainer]
+        else:
+            self.maintainers = list(maintainer)
+        self.maintainer = self.maintainers[0]
+        self.observers = []
+        self.profile = None
 
         # put machines at the front as they should be initialized first
         self.objects.sort(key=lambda obj: not isinstance(obj, Machine))
@@ -57,7 +66,57 @@ class System:
         for sink in self.sinks:
             sink.level = sink.initial_level
 
-        self.maintainer.utilization = 0
+        for maintainer in self.maintainers:
+            maintainer.utilization = 0
+
+    def compile_routing(self):
+        """Validate the routing of the system and build the tuples of givers and
+        receivers each machine selects from during simulation. Buffers, sources, and
+        sinks next to a machine with several givers or receivers keep that machine's
+        set of available givers or receivers up to date as their levels change.
+
+        Raises a ValueError if an asset is routed to an asset that is not part of the
+        system, if routing is not defined consistently on both assets of a connection,
+        or if a machine has no assets upstream or downstream.
+        """
+        assets = set(self.objects)
+        for asset in self.objects:
+            upstream = getattr(asset, 'upstream', [])
+            downstream = getattr(asset, 'downstream', [])
+            for direction, reverse, neighbors in [
+                ('upstream', 'downstream', upstream),
+                ('downstream', 'upstream', downstream)
+            ]:
+                for neighbor in neighbors:
+                    if neighbor not in assets:
+                        raise ValueError(
+                            f'{neighbor.name} is {direction} of {asset.name} but is '
+                            + 'not part of the system'
+                        )
+                    if asset not in getattr(neighbor, reverse, []):
+                        raise ValueError(
+                            f'{neighbor.name} is {direction} of {asset.name} but '
+                            + f'{asset.name} is not {reverse} of {neighbor.name}'
+                        )
+            if isinstance(asset, Machine) and not (upstream and downstream):
+                raise ValueError(
+                    f'Machine {asset.name} must have at least one asset upstream and '
+                    + 'downstream'
+                )
+
+        for asset in self.objects:
+            if hasattr(asset, 'tracking_consumers'):
+                asset.tracking_consumers = []
+            if hasattr(asset, 'tracking_producers'):
+                asset.tracking_producers = []
+        for machine in self.machines:
+            machine.compile_routing()
+            if machine.available_givers is not None:
+                for giver in machine.givers:
+                    giver.tracking_consumers.append(machine)
+            if machine.available_receivers is not None:
+                for receiver in machine.receivers:
+                    receiver.tracking_producers.append(machine)
 
     def simulate(
         self,
@@ -65,37 +124,122 @@ class System:
         simulation_time=0,
         verbose=True,
         trace=False,
-        collect_data=True
+        collect_data=True,
+        seed=None,
+        collect_statistics=False,
+        trace_format='pickle',
+        trace_filter=None,
+        profile=False
     ):
         start = time.time()
+        self.compile_routing()
         for machine in self.machines:
-            machine.maintainer = self.maintainer
+            machine.maintainers = [
+                maintainer for maintainer in self.maintainers
+                if maintainer.can_maintain(machine)
+            ]
+            if machine.maintainers:
+                machine.maintainer = machine.maintainers[0]
+            elif machine.can_request_maintenance():
+                raise ValueError(
+                    f'Machine {machine.name} can request maintenance but is not '
+                    + 'serviced by any maintainer'
+                )
+            else:
+                machine.maintainer = None
 
-        self.env = Environment(trace=trace, collect_data=collect_data)
+        self.env = Environment(
+            trace=trace,
+            collect_data=collect_data,
+            seed=seed,
+            collect_statistics=collect_statistics,
+            warm_up_time=warm_up_time,
+            trace_format=trace_format,
+            trace_filter=trace_filter,
+            profile=profile
+        )
         for obj in self.objects:
             # should initialize machines first
             obj.env = self.env
             obj.initialize()
 
-        self.maintainer.env = self.env
-        self.maintainer.system = self
-        self.maintainer.utilization = 0
+        for maintainer in self.maintainers:
+            maintainer.env = self.env
+            maintainer.system = self
+            maintainer.initialize()
+
+        for callback, action, location, when in self.observers:
+            self.env.add_observer(callback, action, location, when)
 
         self.warm_up_time = warm_up_time
         self.simulation_time = simulation_time
 
         self.env.run(warm_up_time, simulation_time)
+        self.profile = self.env.profile
 
         # clean up data here
         for machine in self.machines:
             if machine.under_repair or machine.failed:
                 machine.downtime += (self.env.now - machine.downtime_start)
+            machine.update_state_times()
+
+        if collect_statistics:
+            for obj in self.objects + self.maintainers:
+                for statistic in getattr(obj, 'statistics', {}).values():
+                    statistic.finalize(self.env.now)
 
         stop = time.time()
         if verbose:
             print(f'Simulation finished in {stop-start:.2f}s')
             print(f'Parts produced: {sum([sink.level for sink in self.sinks])}')
 
+    def register_observer(self, callback, action=None, location=None, when='after'):
+        """Register a function to be called with each event executed during subsequent
+        simulations of the system, optionally only for events with the specified action
+        or at the specified asset. "when" is 'before' or 'after' the event is executed.
+        See `Environment.add_observer`. Observers remain registered for every later
+        simulation until they are removed with `remove_observer` or `clear_observers`,
+        and part transfers are not fused while any are registered.
+
+        For example, to count the failures of machine M1:
+
+            failures = []
+            system.register_observer(failures.append, action='fail', location=M1)
+        """
+        self.observers.append((callback, action, location, when))
+
+    def remove_observer(self, callback, action=None, location=None, when='after'):
+        """Remove a function registered with `register_observer` with the same
+        arguments, so it is not called during subsequent simulations. Raises a
+        ValueError if it is not registered.
+        """
+        try:
+            self.observers.remove((callback, action, location, when))
+        except ValueError:
+            raise ValueError(f'{callback} is not a registered observer') from None
+
+    def clear_observers(self):
+        """Remove all registered observers."""
+        self.observers = []
+
+    def get_statistics(self):
+        """Returns a summary of the statistics accumulated during the last simulation run
+        with "collect_statistics" enabled. The summaries are grouped into lists of
+        'machines', 'buffers', 'sinks', and 'maintainers' in the same order as the
+        corresponding attributes of the system.
+        """
+        def summarize(obj):
+            return {
+                name: statistic.summary() for name, statistic in obj.statistics.items()
+            }
+
+        return {
+            'machines': [summarize(machine) for machine in self.machines],
+            'buffers': [summarize(buffer) for buffer in self.buffers],
+            'sinks': [summarize(sink) for sink in self.sinks],
+            'maintainers': [summarize(maintainer) for maintainer in self.maintainers]
+        }
+
     def iterate_simulation(
         self, 
         replications, 
@@ -104,7 +248,8 @@ class System:
         store_system_state=False,
         verbose=True,
         jobs=1,
-        seedseed=0
+        seedseed=0,
+        runner=None
     ):
         """Replicate multiple simulation runs for a specified system. Statistics for
         each run will gathered after the "warm_up_time" has elapsed. Currently the
@@ -112,18 +257,43 @@ class System:
         - Machine
             - Production (units)
             - Availability (proportion of time not failed or under maintenance)
+            - Operating states (time spent busy, blocked, starved, and down after the
+              warm up period)
         - Sink
             - Level (units): completed parts that have exited the system
 
-        A nested dictionary is returned with "replications" samples of each statistic.
+        A list of "replications" samples is returned. Each sample is a tuple of system
+        production, production of each machine, availability of each machine, the
+        system state (see below), and the time each machine spent in each operating
+        state as a list of dictionaries in the same order as `machines`.
+
+        If "store_system_state" is True, data are collected during each replication and
+        a `SystemState` record of the counters and collected data of each asset is
+        returned with each sample.
+
+        Each replication uses its own independent random number streams, derived from
+        "seedseed" and the index of the replication, so results do not depend on the
+        number of jobs. A single replication can be reproduced by passing
+        `System.replication_seed(seedseed, replication)` as the seed of `simulate`.
+
+        Replications are run by a `ReplicationRunner` with "jobs" worker processes. To
+        reuse the same worker processes across several calls, create a runner with
+        `System.replication_runner` and pass it as "runner".
         """
         start = time.time()      
-        with multiprocessing.Pool(jobs) as p:
-            args = [
-                (seed, warm_up_time, simulation_time, store_system_state)
-                for seed in range(seedseed, seedseed+replications)
-            ]
-            samples = p.starmap(self.simulate_in_parallel, args)
+        if runner is None:
+            with self.replication_runner(jobs) as runner:
+                samples = runner.run(
+                    replications,
+                    warm_up_time,
+                    simulation_time,
+                    store_system_state,
+                    seedseed
+                )
+        else:
+            samples = runner.run(
+                replications, warm_up_time, simulation_time, store_system_state, seedseed
+            )
         stop = time.time()
 
         if verbose:
@@ -131,6 +301,20 @@ class System:
         
         return samples
 
+    def replication_runner(self, jobs=1):
+        """Returns a ReplicationRunner that simulates this system using "jobs" worker
+        processes.
+        """
+        return ReplicationRunner(self, jobs)
+
+    @staticmethod
+    def replication_seed(seedseed, replication):
+        """Returns the seed used for the specified replication by iterate_simulation.
+        This is the same seed sequence obtained by spawning "replication"+1 children
+        from `numpy.random.SeedSequence(seedseed)`.
+        """
+        return np.random.SeedSequence(seedseed, spawn_key=(replication,))
+
     def simulate_in_parallel(
         self, 
         seed, 
@@ -138,13 +322,12 @@ class System:
         simulation_time, 
         store_system_state=False
     ):
-        random.seed()
-        
         self.simulate(
             warm_up_time, 
             simulation_time, 
             verbose=False, 
-            collect_data=store_system_state
+            collect_data=store_system_state,
+            seed=seed
         )
 
         availability = [
@@ -157,13 +340,94 @@ class System:
         system_production = sum([sink.level for sink in self.sinks])
 
         if store_system_state:
-            system_state = copy.deepcopy(self)
+            system_state = SystemState(self)
         else:
             system_state = None
 
+        state_times = [dict(machine.state_times) for machine in self.machines]
+
         return (
             system_production, 
             machine_production, 
             availability, 
-            system_state
+            system_state,
+            state_times
+        )
+
+
+# The system simulated by a replication worker process, set when the worker starts
+_worker_system = None
+
+def _initialize_worker(system):
+    global _worker_system
+    _worker_system = system
+
+def _run_replication(args):
+    replication, seed, warm_up_time, simulation_time, store_system_state = args
+    sample = _worker_system.simulate_in_parallel(
+        seed, warm_up_time, simulation_time, store_system_state
+    )
+    return replication, sample
+
+class ReplicationRunner:
+    """Runs replications of a system in a pool of worker processes. The system is sent
+    to each worker once when the pool is started, after which only replication seeds are
+    dispatched to the workers in chunks. The pool is kept open until the runner is
+    closed, so a runner can be reused for several batches of replications. Changes made
+    to the system after the runner is created are not seen by the workers.
+
+    Runners can be used as context managers:
+
+        with system.replication_runner(jobs=10) as runner:
+            samples = runner.run(replications=500, simulation_time=utils.WEEK)
+    """
+    def __init__(self, system, jobs=1):
+        self.system = system
+        self.jobs = jobs
+        self.pool = multiprocessing.Pool(
+            jobs, initializer=_initialize_worker, initargs=(system,)
         )
+
+    def run(
+        self,
+        replications,
+        warm_up_time=0,
+        simulation_time=0,
+        store_system_state=False,
+        seedseed=0,
+        chunksize=None
+    ):
+        """Simulate the specified number of replications and return their results in
+        order of replication. The seed of each replication is derived from "seedseed"
+        as in `System.iterate_simulation`.
+        """
+        if chunksize is None:
+            chunksize = max(1, replications // (4 * self.jobs))
+
+        args = (
+            (
+                replication,
+                System.replication_seed(seedseed, replication),
+                warm_up_time,
+                simulation_time,
+                store_system_state
+            )
+            for replication in range(replications)
+        )
+
+        samples = [None] * replications
+        for replication, sample in self.pool.imap_unordered(
+            _run_replication, args, chunksize
+        ):
+            samples[replication] = sample
+        return samples
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
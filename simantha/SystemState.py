@@ -0,0 +1,84 @@
+import numpy as np
+
+class AssetState:
+    """
+    A snapshot of a single asset at the end of a simulation run. Counters of the asset
+    are stored as attributes and its collected data are stored as dictionaries of NumPy
+    arrays with the same names as on the original asset, so the snapshot can be
+    analyzed in the same way as the asset itself, e.g., `state.parts_made` or
+    `state.production_data['time']`.
+    """
+    def __init__(self, asset, counters=(), data=()):
+        self.name = asset.name
+        self.counters = list(counters)
+        self.data = list(data)
+
+        for counter in self.counters:
+            setattr(self, counter, getattr(asset, counter, None))
+
+        for name in self.data:
+            setattr(self, name, {
+                key: np.asarray(values)
+                for key, values in getattr(asset, name).items()
+            })
+
+    def to_dict(self):
+        """Returns the snapshot as a dictionary of counters and data arrays."""
+        state = {'name': self.name}
+        for counter in self.counters:
+            state[counter] = getattr(self, counter)
+        for name in self.data:
+            state[name] = dict(getattr(self, name))
+        return state
+
+class SystemState:
+    """
+    A compact record of the state of a system at the end of a simulation run. Only
+    counters and collected data are kept, rather than a copy of the system and its
+    simulation environment, so states are cheap to pickle when returned from
+    replications. Assets are grouped in the same way as the system, e.g.,
+    `state.machines[0].production_data`.
+    """
+    machine_counters = [
+        'parts_made', 'downtime', 'health', 'failed', 'under_repair', 'state_times'
+    ]
+    machine_data = ['production_data', 'health_data', 'maintenance_data']
+    buffer_counters = ['level', 'capacity']
+    buffer_data = ['level_data']
+    sink_counters = ['level']
+    maintainer_counters = ['utilization', 'capacity']
+
+    def __init__(self, system):
+        self.time = system.env.now
+        self.warm_up_time = system.warm_up_time
+        self.simulation_time = system.simulation_time
+
+        self.machines = [
+            AssetState(machine, self.machine_counters, self.machine_data)
+            for machine in system.machines
+        ]
+        self.buffers = [
+            AssetState(buffer, self.buffer_counters, self.buffer_data)
+            for buffer in system.buffers
+        ]
+        self.sinks = [AssetState(sink, self.sink_counters) for sink in system.sinks]
+        self.maintainers = [
+            AssetState(maintainer, self.maintainer_counters)
+            for maintainer in system.maintainers
+        ]
+        self.maintainer = self.maintainers[0]
+
+    def to_dict(self):
+        """Returns the state as nested dictionaries and lists of NumPy arrays, suitable
+        for loading into other analysis tools.
+        """
+        return {
+            'time': self.time,
+            'warm_up_time': self.warm_up_time,
+            'simulation_time': self.simulation_time,
+            'machines': [machine.to_dict() for machine in self.machines],
+            'buffers': [buffer.to_dict() for buffer in self.buffers],
+            'sinks': [sink.to_dict() for sink in self.sinks],
+            'maintainer': self.maintainer.to_dict(),
+            'maintainers': [maintainer.to_dict() for maintainer in self.maintainers]
+        }
@@ -1,10 +1,14 @@
-from .System import System
+from .System import System, ReplicationRunner
 from .Source import *
 from .Machine import *
 from .Buffer import *
 from .Sink import *
 from .Maintainer import *
+from .SystemState import *
+from .data import *
+from .profiler import *
 from .simulation import *
+from .trace import TraceFilter, TraceReader, TraceWriter
 from .utils import *
 
 #__name__ = 'simantha'
@@ -0,0 +1,231 @@
+from array import array
+
+import numpy as np
+
+class DataColumn:
+    """
+    A growable column of numeric data collected during a simulation. Values are stored
+    in a typed array rather than a list of Python objects. Integer values are stored
+    as 64-bit integers; if a value that is not an integer is appended the column is
+    converted to double precision floats, unless "widen" is False, in which case a
+    TypeError is raised instead. Columns support the same read access as lists,
+    including indexing, slicing, iteration, `index`, `count`, `copy`, and concatenation
+    with `+`. Slices, copies, and concatenations are returned as lists.
+    """
+    def __init__(self, values=(), typecode='q', widen=True):
+        self.values = array(typecode)
+        self.widen = widen
+        self.bind_append()
+        for value in values:
+            self.append(value)
+
+    def bind_append(self):
+        # Appending to the array directly avoids a Python-level call for each value
+        # once the column can no longer be converted
+        if self.values.typecode == 'd' or not self.widen:
+            self.append = self.values.append
+
+    def __getstate__(self):
+        # The bound append refers to the original array, so it is bound again to the
+        # array of a copied or unpickled column
+        state = dict(self.__dict__)
+        state.pop('append', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bind_append()
+
+    def append(self, value):
+        try:
+            self.values.append(value)
+        except (TypeError, OverflowError):
+            if self.values.typecode == 'd':
+                raise
+            self.values = array('d', self.values)
+            self.values.append(value)
+            self.bind_append()
+
+    def index(self, value):
+        return self.values.index(value)
+
+    def count(self, value):
+        return self.values.count(value)
+
+    def copy(self):
+        return list(self)
+
+    def to_numpy(self):
+        """Returns a copy of the column as a NumPy array."""
+        return np.array(self.values)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.values, dtype=dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.values[key].tolist()
+        return self.values[key]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return repr(self.values.tolist())
+
+class CategoricalColumn(DataColumn):
+    """
+    A column of categorical data, such as maintenance events. Each distinct value is
+    stored once in `categories` and the column itself stores small integer codes.
+    Reading from the column returns the original values.
+    """
+    def __init__(self, values=(), categories=()):
+        self.categories = list(categories)
+        self.codes = {category: code for code, category in enumerate(self.categories)}
+        super().__init__(values, typecode='B')
+
+    def bind_append(self):
+        # Values are always converted to codes
+        pass
+
+    def append(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(value)
+            self.codes[value] = code
+            if code > 255 and self.values.typecode == 'B':
+                self.values = array('l', self.values)
+        self.values.append(code)
+
+    def index(self, value):
+        return self.values.index(self.codes.get(value, -1))
+
+    def count(self, value):
+        code = self.codes.get(value)
+        return 0 if code is None else self.values.count(code)
+
+    def to_numpy(self):
+        """Returns a copy of the column as a NumPy array of its values."""
+        categories = np.array(self.categories, dtype=str)
+        return categories[np.array(self.values, dtype=np.intp)]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_numpy() if dtype is None else self.to_numpy().astype(dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.categories[code] for code in self.values[key]]
+        return self.categories[self.values[key]]
+
+    def __iter__(self):
+        return (self.categories[code] for code in self.values)
+
+    def __repr__(self):
+        return repr(list(self))
+
+class TimeWeightedStatistic:
+    """
+    Incrementally computes the time-weighted mean and variance of a quantity that
+    changes at discrete times, such as a buffer level. Only time after `start` (usually
+    the end of the warm up period) is counted. Memory use does not depend on the
+    length of the simulation.
+    """
+    def __init__(self, value=0, time=0, start=0):
+        self.value = value
+        self.last_time = time
+        self.start = start
+
+        self.total_time = 0
+        self.mean = 0
+        self.sum_of_squares = 0
+
+    def update(self, time, value):
+        """Record that the quantity changed to "value" at "time"."""
+        self.finalize(time)
+        self.value = value
+
+    def finalize(self, time):
+        """Account for the current value up to "time"."""
+        duration = time - max(self.last_time, self.start)
+        if duration > 0:
+            # Weighted incremental algorithm for the mean and variance
+            self.total_time += duration
+            delta = self.value - self.mean
+            self.mean += delta * duration / self.total_time
+            self.sum_of_squares += duration * delta * (self.value - self.mean)
+        if time > self.last_time:
+            self.last_time = time
+
+    @property
+    def variance(self):
+        if self.total_time == 0:
+            return 0
+        return self.sum_of_squares / self.total_time
+
+    def summary(self):
+        return {'mean': self.mean, 'variance': self.variance}
+
+class TimeInStateStatistic:
+    """
+    Accumulates the total time spent in each distinct state, such as the health states
+    of a machine, after `start`.
+    """
+    def __init__(self, state=None, time=0, start=0):
+        self.state = state
+        self.last_time = time
+        self.start = start
+
+        self.time_in_state = {}
+
+    def update(self, time, state):
+        self.finalize(time)
+        self.state = state
+
+    def finalize(self, time):
+        duration = time - max(self.last_time, self.start)
+        if duration > 0:
+            self.time_in_state[self.state] = (
+                self.time_in_state.get(self.state, 0) + duration
+            )
+        if time > self.last_time:
+            self.last_time = time
+
+    def summary(self):
+        return dict(self.time_in_state)
+
+class RateStatistic:
+    """Counts occurrences after `start` and reports their rate per unit time."""
+    def __init__(self, start=0):
+        self.start = start
+        self.count = 0
+        self.last_time = start
+
+    def increment(self, time, quantity=1):
+        if time > self.start:
+            self.count += quantity
+
+    def finalize(self, time):
+        if time > self.last_time:
+            self.last_time = time
+
+    @property
+    def rate(self):
+        if self.last_time <= self.start:
+            return 0
+        return self.count / (self.last_time - self.start)
+
+    def summary(self):
+        return {'count': self.count, 'rate': self.rate}
@@ -8,15 +8,16 @@ import random
 from simantha import Source, Machine, Buffer, Sink, Maintainer, System, utils
 
 class LptMaintainer(Maintainer):
-    """Chooses the maintenance action with the longest expected duration first."""
-    def choose_maintenance_action(self, queue):
-        def expected_repair_time(machine):
-            if machine.failed: # Machine requires corrective maintenance
-                return machine.cm_distribution.mean
-            else: # Machine requires preventive maintenance
-                return machine.pm_distribution.mean
-
-        return max(queue, key=expected_repair_time)
+    """Chooses the maintenance action with the longest expected duration first. The
+    same policy is available as `Maintainer(policy='lpt')`. Policies that cannot be
+    expressed as a key can override `choose_maintenance_action(queue)` instead.
+    """
+    def policy_key(self, machine):
+        # Machines with the lowest key are maintained first
+        if machine.failed: # Machine requires corrective maintenance
+            return -machine.cm_distribution.mean
+        else: # Machine requires preventive maintenance
+            return -machine.pm_distribution.mean
 
 def main():
     degradation_matrix = [
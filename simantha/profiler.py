@@ -0,0 +1,110 @@
+import time
+
+class SimulationProfile:
+    """
+    Performance measurements of a simulation run, recorded when profiling is enabled.
+    For each combination of asset and action the number of executed and canceled events
+    and the cumulative wall time spent processing them are recorded in `events`, which
+    can be summarized by action with `by_action` or by asset with `by_asset`. The length
+    of the event calendar before each event is used to find its peak and average
+    length. Wall times are measured in seconds and include the time taken to remove the
+    event from the calendar.
+    """
+    def __init__(self):
+        # (asset name, action name) -> [executed, canceled, wall time]
+        self.events = {}
+        self.event_count = 0
+        self.peak_queue_length = 0
+        self.total_queue_length = 0
+
+        self.start_time = None
+        self.wall_time = 0
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        self.wall_time = time.perf_counter() - self.start_time
+
+    def get_counts(self, event):
+        key = (event.location.name, event.action.__name__)
+        counts = self.events.get(key)
+        if counts is None:
+            counts = self.events[key] = [0, 0, 0]
+        return counts
+
+    def record(self, event, wall_time, queue_length):
+        counts = self.get_counts(event)
+        # Canceled events are counted when they are canceled, since they may be removed
+        # from the calendar without being popped
+        if not event.canceled:
+            counts[0] += 1
+        counts[2] += wall_time
+
+        self.event_count += 1
+        self.total_queue_length += queue_length
+        if queue_length > self.peak_queue_length:
+            self.peak_queue_length = queue_length
+
+    def record_cancellation(self, event):
+        self.get_counts(event)[1] += 1
+
+    @property
+    def average_queue_length(self):
+        if self.event_count == 0:
+            return 0
+        return self.total_queue_length / self.event_count
+
+    @property
+    def events_per_second(self):
+        if self.wall_time == 0:
+            return 0
+        return self.event_count / self.wall_time
+
+    def by_action(self):
+        """Returns the executed count, canceled count, and wall time of each action."""
+        return self.aggregate(1)
+
+    def by_asset(self):
+        """Returns the executed count, canceled count, and wall time of each asset."""
+        return self.aggregate(0)
+
+    def aggregate(self, position):
+        totals = {}
+        for key, (executed, canceled, wall_time) in self.events.items():
+            total = totals.setdefault(
+                key[position], {'executed': 0, 'canceled': 0, 'wall_time': 0}
+            )
+            total['executed'] += executed
+            total['canceled'] += canceled
+            total['wall_time'] += wall_time
+        return totals
+
+    def summary(self):
+        return {
+            'events': self.event_count,
+            'wall_time': self.wall_time,
+            'events_per_second': self.events_per_second,
+            'peak_queue_length': self.peak_queue_length,
+            'average_queue_length': self.average_queue_length,
+            'actions': self.by_action(),
+            'assets': self.by_asset()
+        }
+
+    def __repr__(self):
+        lines = [
+            f'{self.event_count} events in {self.wall_time:.2f}s '
+            + f'({self.events_per_second:.0f} events/s)',
+            f'Event queue length: peak {self.peak_queue_length}, '
+            + f'average {self.average_queue_length:.1f}',
+            f'{"action":<24}{"executed":>10}{"canceled":>10}{"time (s)":>10}'
+        ]
+        actions = sorted(
+            self.by_action().items(), key=lambda item: item[1]['wall_time'], reverse=True
+        )
+        for action, total in actions:
+            lines.append(
+                f'{action:<24}{total["executed"]:>10}{total["canceled"]:>10}'
+                + f'{total["wall_time"]:>10.3f}'
+            )
+        return '\n'.join(lines)
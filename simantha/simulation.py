@@ -1,10 +1,15 @@
-import bisect
+import heapq
 import pickle
 import random
 import sys
 import time
 import warnings
 
+import numpy as np
+
+from .profiler import SimulationProfile
+from .trace import TraceFilter, TraceWriter
+
 class Event:
     action_priority = [
         # Events at the end of the last time step
@@ -31,7 +36,22 @@ class Event:
         action: priority for priority, action in enumerate(action_priority)
     }
 
-    def __init__(self, time, location, action, source='', priority=0, status=''):
+    __slots__ = (
+        'time',
+        'location',
+        'action',
+        'source',
+        'priority',
+        'status',
+        'tiebreak',
+        'canceled',
+        'executed',
+        'key'
+    )
+
+    def __init__(
+        self, time, location, action, source='', priority=0, status='', tiebreak=None
+    ):
         self.time = time
         self.location = location
         self.action = action
@@ -39,16 +59,21 @@ class Event:
         self.priority = priority
         self.status = status
 
-        self.tiebreak = random.random()
+        if tiebreak is None:
+            self.tiebreak = random.random()
+        else:
+            self.tiebreak = tiebreak
 
         self.canceled = False
         self.executed = False
+
+        # The ordering key is computed once so that comparisons in the event calendar
+        # do not need to look up the action priority again. Subclasses that override
+        # get_action_priority are accounted for here.
+        self.key = (time, self.get_action_priority(), priority, self.tiebreak)
     
     def get_action_priority(self):
-        if self.action.__name__ in self.action_priority.keys():
-            return self.action_priority[self.action.__name__]
-        else:
-            return float('inf')
+        return self.action_priority.get(self.action.__name__, float('inf'))
 
     def execute(self):
         if not self.canceled:
@@ -58,33 +83,139 @@ class Event:
         self.executed = True
 
     def __lt__(self, other):
-        return (
-            self.time, 
-            self.get_action_priority(),
-            self.priority, 
-            self.tiebreak
-        ) < (
-            other.time, 
-            other.get_action_priority(),
-            other.priority, 
-            other.tiebreak
-        )
+        return self.key < other.key
+
+class EventCalendar:
+    """A binary heap of pending simulation events. Events are popped in the order
+    defined by their precomputed ordering keys. Iterating over the calendar yields the
+    pending events in execution order, so the calendar can be inspected in the same way
+    as a sorted list.
+    """
+    def __init__(self, events=()):
+        # Heap entries are (key, event) pairs so that comparisons are made between
+        # tuples without calling back into Event.__lt__
+        self.heap = [(event.key, event) for event in events]
+        heapq.heapify(self.heap)
+
+    def push(self, event):
+        heapq.heappush(self.heap, (event.key, event))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[1]
+
+    def peek(self):
+        return self.heap[0][1]
+
+    def compact(self):
+        """Remove canceled events from the calendar."""
+        self.heap = [entry for entry in self.heap if not entry[1].canceled]
+        heapq.heapify(self.heap)
+
+    def __iter__(self):
+        return (event for _, event in sorted(self.heap))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __bool__(self):
+        return len(self.heap) > 0
+
+def format_source(source):
+    """Render the provenance of an event as a string. To avoid formatting strings for
+    every scheduled event, assets provide the source of an event as a tuple of the form
+    (asset name, action name) or (asset name, action name, time), which is only
+    rendered when the event is traced. Plain strings are returned unchanged.
+    """
+    if type(source) is tuple:
+        if len(source) == 3:
+            return f'{source[0]}.{source[1]} at {source[2]}'
+        else:
+            return '.'.join(str(part) for part in source)
+    return source
 
 class Environment:
     """The main simulation environment for Simantha. This is designed to be an
     enviroment specifically for use with Simantha objects and is not intended to be a
     general simulation engine. In general, users of Simantha should not need to
     instantiate an Environment object.
+
+    All random numbers drawn during a simulation come from streams owned by the
+    environment and derived from `seed`, which may be an integer or a
+    `numpy.random.SeedSequence`. If no seed is given one is drawn from Python's `random`
+    module, so `random.seed` can still be used to make a simulation reproducible.
+
+    If `trace` is True, every executed event is recorded. With the default
+    `trace_format` of 'pickle' the trace is kept in memory and pickled to
+    `{name}_trace.pkl` when the simulation ends. With 'binary' the trace is streamed to
+    `{name}_trace.bin` in chunks of `trace_chunk_size` events using a `TraceWriter`,
+    and can be read with a `TraceReader`. A `TraceFilter` may be given as
+    `trace_filter` to record only some of the events.
+
+    Functions can be registered with `add_observer` to be called before or after each
+    executed event, for example to collect custom metrics. When no observers are
+    registered, events are executed without checking for them. Part transfers are not
+    fused while observers are registered.
+
+    If `profile` is True, the number of events executed and canceled and the wall time
+    spent on them are recorded by asset and action in a `SimulationProfile`, available
+    as the `profile` attribute of the environment after the simulation.
     """
-    def __init__(self, name='environment', trace=False, collect_data=True):
-        self.events = []
+    # Canceled events are left in the calendar and discarded when they are popped. Once
+    # they make up more than this fraction of the calendar it is compacted.
+    compaction_ratio = 0.5
+    compaction_minimum = 256
+
+    def __init__(
+        self,
+        name='environment',
+        trace=False,
+        collect_data=True,
+        seed=None,
+        collect_statistics=False,
+        warm_up_time=0,
+        trace_format='pickle',
+        trace_chunk_size=65536,
+        trace_filter=None,
+        profile=False
+    ):
+        self.events = EventCalendar()
+        # Live (scheduled but not yet executed or canceled) events of each location
+        self.location_events = {}
+        # Number of live events for each (location, action name) pair
+        self.pending_actions = {}
+        self.canceled_events = 0
+
+        if seed is None:
+            seed = random.getrandbits(64)
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed = seed
+        tiebreak_seed, random_seed, generator_seed = seed.spawn(3)
+        # Tiebreaks are drawn from a separate stream so that the number of scheduled
+        # events does not affect the random numbers drawn by the simulated assets
+        self.tiebreaks = random.Random(int(tiebreak_seed.generate_state(1)[0]))
+        # Stream used by assets for random choices, such as selecting a receiver
+        self.random = random.Random(int(random_seed.generate_state(1)[0]))
+        # Generator used by distributions to draw blocks of random samples
+        self.generator = np.random.default_rng(generator_seed)
         self.name = name
         self.now = 0
 
         self.terminated = False
 
+        if trace_format not in ('pickle', 'binary'):
+            raise ValueError(
+                f'Invalid trace format {trace_format}. Trace format should be one of '
+                + 'pickle, binary'
+            )
         self.trace = trace
-        if self.trace:
+        self.trace_filter = trace_filter
+        if trace_filter is not None:
+            trace_filter.reset()
+        self.trace_writer = None
+        if self.trace and trace_format == 'binary':
+            self.trace_writer = TraceWriter(f'{self.name}_trace.bin', trace_chunk_size)
+        elif self.trace:
             self.event_trace = {
                 'time': [],
                 'location': [],
@@ -96,6 +227,15 @@ class Environment:
             }
 
         self.collect_data = collect_data
+        self.collect_statistics = collect_statistics
+        self.warm_up_time = warm_up_time
+
+        # Observers are stored by (location, action name), where None matches any
+        # location or action
+        self.observers = {'before': {}, 'after': {}}
+        self.observed = False
+
+        self.profile = SimulationProfile() if profile else None
 
     def run(self, warm_up_time=0, simulation_time=0):
         """Simulate the system for the specified run time or until no simulation events
@@ -105,31 +245,64 @@ class Environment:
         self.warm_up_time = warm_up_time
         self.simulation_time = simulation_time
         self.terminated = False
-        self.events.append(Event(warm_up_time+simulation_time, self, self.terminate))
+        # Terminate is ordered after every other action, so no tiebreak is drawn for it
+        self.events.push(
+            Event(warm_up_time+simulation_time, self, self.terminate, tiebreak=0)
+        )
         self.event_index = 0
 
-        self.events.sort()
-
-        while self.events and not self.terminated:
-            self.step()
-            self.event_index += 1
+        if self.profile is None:
+            while self.events and not self.terminated:
+                self.step()
+                self.event_index += 1
+        else:
+            self.run_profiled()
 
         if self.trace:
             self.export_trace()
 
+    def run_profiled(self):
+        profile = self.profile
+        clock = time.perf_counter
+        profile.start()
+        while self.events and not self.terminated:
+            queue_length = len(self.events)
+            start = clock()
+            event = self.step()
+            profile.record(event, clock() - start, queue_length)
+            self.event_index += 1
+        profile.stop()
+
     def step(self):
         """Find and execute the next earliest simulation event. Simultaneous events are
         executed in order according to their event type priority, then their
         user-assigned priority. If these values are equal then ties are broken randomly. 
         """
-        next_event = self.events.pop(0)
+        next_event = self.events.pop()
+        if next_event.canceled:
+            self.canceled_events -= 1
+        else:
+            live_events = self.location_events.get(next_event.location)
+            if live_events is not None:
+                live_events.discard(next_event)
+                self.pending_actions[
+                    (next_event.location, next_event.action.__name__)
+                ] -= 1
 
         self.now = next_event.time
 
         try:
-            if self.trace:
+            if self.trace and (
+                self.trace_filter is None
+                or self.trace_filter.accepts(next_event, self.now)
+            ):
                 self.trace_event(next_event)
-            next_event.execute()
+            if self.observed and not next_event.canceled:
+                self.notify_observers('before', next_event)
+                next_event.execute()
+                self.notify_observers('after', next_event)
+            else:
+                next_event.execute()
         except:
             self.export_trace()
             print('Failed event:')
@@ -139,21 +312,151 @@ class Environment:
             print(f'  priority: {next_event.priority}')
             sys.exit()
 
+        return next_event
+
     def schedule_event(
         self, time, location, action, source='', priority=0, event_type=Event
     ):
-        new_event = Event(time, location, action, source, priority)
-        bisect.insort(self.events, new_event)
+        new_event = event_type(
+            time, location, action, source, priority, tiebreak=self.tiebreaks.random()
+        )
+        self.events.push(new_event)
+
+        live_events = self.location_events.get(location)
+        if live_events is None:
+            self.location_events[location] = {new_event}
+        else:
+            live_events.add(new_event)
+
+        key = (location, action.__name__)
+        self.pending_actions[key] = self.pending_actions.get(key, 0) + 1
+
+    def has_pending(self, location, action_name):
+        """Returns True if the location has a live event with the specified action."""
+        return self.pending_actions.get((location, action_name), 0) > 0
+
+    def runs_next(self, time, action):
+        """Returns True if an event with the specified time and action, scheduled from
+        the current event, would be executed immediately after the current event. That
+        is the case if no pending event precedes or ties with it. Always returns False
+        while tracing, profiling, or when observers are registered so that every event
+        passes through `step`.
+        """
+        if self.trace or self.observed or self.profile is not None:
+            return False
+        if not self.events:
+            return True
+        action_priority = Event.action_priority.get(action.__name__, float('inf'))
+        # The tiebreak of an event is less than one, so a tie with the next event on
+        # time and priority is not considered as running next
+        return (time, action_priority, 0, 1) < self.events.peek().key
+
+    def execute_or_schedule(self, location, action, source=''):
+        """Execute a zero-delay action immediately if it would be the next event to run,
+        otherwise schedule it at the current time.
+        """
+        if self.runs_next(self.now, action):
+            # A tiebreak is drawn regardless so that subsequent events receive the same
+            # tiebreaks as if the action had been scheduled
+            self.tiebreaks.random()
+            action()
+        else:
+            self.schedule_event(self.now, location, action, source)
+
+    def cancel_events(self, location):
+        """Cancel all pending events scheduled at the specified location. Canceled
+        events remain in the calendar until they are popped or the calendar is
+        compacted.
+        """
+        live_events = self.location_events.get(location)
+        if not live_events:
+            return
+
+        pending_actions = self.pending_actions
+        for event in live_events:
+            event.canceled = True
+            pending_actions[(location, event.action.__name__)] -= 1
+            if self.profile is not None:
+                self.profile.record_cancellation(event)
+        self.canceled_events += len(live_events)
+        live_events.clear()
+
+        # Canceled events are kept while tracing so that they appear in the trace
+        if (
+            not self.trace
+            and self.canceled_events > self.compaction_minimum
+            and self.canceled_events > self.compaction_ratio * len(self.events)
+        ):
+            self.events.compact()
+            self.canceled_events = 0
+
+    def add_observer(self, callback, action=None, location=None, when='after'):
+        """Register a function to be called with each event that is executed at the
+        specified location and with the specified action, given as an action name or
+        method. If either is None, events at any location or with any action are
+        observed. "when" is 'before' or 'after' the event is executed. Canceled events
+        are not observed. While any observers are registered, part transfers are not
+        fused so that every step of a transfer is observed.
+        """
+        if when not in self.observers:
+            raise ValueError(
+                f'Invalid observer timing {when}. Should be one of before, after'
+            )
+        action = getattr(action, '__name__', action)
+        self.observers[when].setdefault((location, action), []).append(callback)
+        self.observed = True
+
+    def remove_observer(self, callback, action=None, location=None, when='after'):
+        """Remove a function registered with `add_observer` with the same arguments.
+        Raises a ValueError if it is not registered.
+        """
+        action = getattr(action, '__name__', action)
+        key = (location, action)
+        callbacks = self.observers.get(when, {}).get(key)
+        if not callbacks or callback not in callbacks:
+            raise ValueError(f'{callback} is not a registered observer')
+        callbacks.remove(callback)
+        if not callbacks:
+            del self.observers[when][key]
+        self.observed = any(self.observers.values())
+
+    def clear_observers(self):
+        """Remove all registered observers."""
+        self.observers = {'before': {}, 'after': {}}
+        self.observed = False
+
+    def notify_observers(self, when, event):
+        observers = self.observers[when]
+        if not observers:
+            return
+        action = event.action.__name__
+        for key in (
+            (None, None), (event.location, None), (None, action), (event.location, action)
+        ):
+            callbacks = observers.get(key)
+            if callbacks is not None:
+                for callback in callbacks:
+                    callback(event)
 
     def terminate(self):
         self.terminated = True
 
     def trace_event(self, event):
-        if self.trace:
+        if self.trace_writer is not None:
+            self.trace_writer.write(
+                self.now,
+                event.location.name,
+                event.action.__name__,
+                event.source,
+                event.priority,
+                'canceled' if event.canceled else event.status,
+                self.event_index
+            )
+        elif self.trace:
             self.event_trace['time'].append(self.now)
             self.event_trace['location'].append(event.location.name)
             self.event_trace['action'].append(event.action.__name__)
-            self.event_trace['source'].append(event.source)
+            self.event_trace['source'].append(format_source(event.source))
             self.event_trace['priority'].append(event.priority)
             if event.canceled:
                 self.event_trace['status'].append('canceled')
@@ -162,7 +465,9 @@ class Environment:
             self.event_trace['index'].append(self.event_index)
 
     def export_trace(self):
-        if self.trace:
+        if self.trace_writer is not None:
+            self.trace_writer.close()
+        elif self.trace:
             trace_file = open(f'{self.name}_trace.pkl', 'wb')
             pickle.dump(self.event_trace, trace_file)
             trace_file.close()
@@ -188,7 +493,17 @@ class Distribution:
     can be used. The built-in distributions are discrete uniform, specified by passing
     {'uniform': [a, b]} to the distribution object, and geometric, specified via
     {'geometric': p}. Constant integer values are also permitted. 
+
+    Random samples are generated in blocks using a NumPy generator and returned one at a
+    time. The block size starts small and doubles with each refill up to
+    `max_block_size`, so rarely sampled distributions do not hold large buffers. The
+    generator is supplied by the environment when the distribution is initialized, or is
+    seeded from Python's `random` module otherwise, so `random.seed` continues to
+    control reproducibility.
     """
+    initial_block_size = 16
+    max_block_size = 4096
+
     def __init__(self, distribution):
         if type(distribution) == int:
             self.distribution_type = 'constant'
@@ -215,23 +530,47 @@ class Distribution:
         else:
             self.mean = None
 
+        self.initialize()
+
+    def initialize(self, generator=None):
+        """Discard any buffered samples and draw subsequent samples from the specified
+        NumPy generator.
+        """
+        self.generator = generator
+        self.buffer = []
+        self.position = 0
+        self.block_size = self.initial_block_size
+
+    def refill(self):
+        if self.generator is None:
+            self.generator = np.random.default_rng(random.getrandbits(64))
+
+        if self.distribution_type == 'uniform':
+            a, b = self.distribution_parameters
+            block = self.generator.integers(a, b+1, size=self.block_size)
+        elif self.distribution_type == 'geometric':
+            # Number of trials needed to achieve a single success, where the
+            # probability of success for each trial is p
+            block = self.generator.geometric(
+                self.distribution_parameters, size=self.block_size
+            )
+
+        # Samples are converted to Python integers once per block
+        self.buffer = block.tolist()
+        self.position = 0
+        self.block_size = min(2 * self.block_size, self.max_block_size)
+
     def sample(self):
         """Returns a single sample from the specified distribution."""
         if self.distribution_type == 'constant':
             return self.distribution_parameters
 
-        elif self.distribution_type == 'uniform':
-            a, b = self.distribution_parameters
-            return random.randint(a, b)
-
-        elif self.distribution_type == 'geometric':
-            # Returns the number of trials needed to achieve a single success, where the
-            # probability of success for each trial is p.
-            p = self.distribution_parameters
-            s = 1
-            while random.random() > p:
-                s += 1
-            return s
+        elif self.distribution_type in ('uniform', 'geometric'):
+            if self.position == len(self.buffer):
+                self.refill()
+            value = self.buffer[self.position]
+            self.position += 1
+            return value
 
 class ContinuousDistribution:
     def __init__(self, distribution):
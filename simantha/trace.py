@@ -0,0 +1,314 @@
+import math
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+# Each trace file begins with a magic number and format version, followed by a sequence
+# of chunks. A chunk consists of a header giving the number of events in the chunk, the
+# number of strings first used in the chunk, and the length of those strings in bytes.
+# The new strings follow, encoded in UTF-8 and separated by null bytes, padded so that
+# the columns are aligned to eight bytes. The columns of the chunk are then written one after another.
+# Locations, actions, and statuses are stored as codes into the table of strings, which
+# is built up from the strings of every chunk read so far.
+MAGIC = b'SMTR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sI')
+CHUNK_HEADER = struct.Struct('<III')
+
+# Columns of a trace chunk, in the order they are stored. The source of an event is
+# split into its asset, action, and time, which is NaN if the source has no time.
+COLUMNS = [
+    ('time', 'd'),
+    ('source_time', 'd'),
+    ('priority', 'd'),
+    ('index', 'q'),
+    ('location', 'I'),
+    ('action', 'I'),
+    ('source_location', 'I'),
+    ('source_action', 'I'),
+    ('status', 'I')
+]
+DTYPES = {'d': '<f8', 'q': '<i8', 'I': '<u4'}
+EVENT_SIZE = sum(np.dtype(DTYPES[typecode]).itemsize for _, typecode in COLUMNS)
+
+def render_time(time):
+    # Times are stored as floats, integral times are shown as integers
+    if time.is_integer():
+        return str(int(time))
+    return str(time)
+
+class TraceWriter:
+    """Writes an event trace to disk in fixed-size chunks as a simulation proceeds, so
+    the memory used by the trace does not grow with the length of the simulation and
+    the events traced before a crash are kept. Events are buffered in typed arrays and
+    a chunk of "chunk_size" events is written whenever the buffer is full.
+
+    Traces written by a TraceWriter are read with a `TraceReader`.
+    """
+    def __init__(self, path, chunk_size=65536):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+        # The empty string always has code 0
+        self.codes = {'': 0}
+        self.new_strings = []
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.size = 0
+        self.events_written = 0
+
+    def intern(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.codes)
+            self.codes[string] = code
+            self.new_strings.append(string)
+        return code
+
+    def write(self, time, location, action, source, priority, status, index):
+        """Add an event to the trace. The source of the event may be a string or a
+        tuple as described in `format_source`.
+        """
+        if type(source) is tuple:
+            source_location = self.intern(str(source[0]))
+            source_action = self.intern(str(source[1]))
+            source_time = source[2] if len(source) == 3 else math.nan
+        else:
+            source_location = self.intern(source)
+            source_action = 0
+            source_time = math.nan
+
+        columns = self.columns
+        columns['time'].append(time)
+        columns['source_time'].append(source_time)
+        columns['priority'].append(priority)
+        columns['index'].append(index)
+        columns['location'].append(self.intern(location))
+        columns['action'].append(self.intern(action))
+        columns['source_location'].append(source_location)
+        columns['source_action'].append(source_action)
+        columns['status'].append(self.intern(status))
+
+        self.size += 1
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered events to disk as a chunk."""
+        if self.size == 0:
+            return
+
+        strings = '\0'.join(self.new_strings).encode('utf-8')
+        # Pad so the columns begin at a multiple of eight bytes from the start of the file
+        padding = -(self.file.tell() + CHUNK_HEADER.size + len(strings)) % 8
+        self.file.write(CHUNK_HEADER.pack(self.size, len(self.new_strings), len(strings)))
+        self.file.write(strings + bytes(padding))
+
+        for name, typecode in COLUMNS:
+            column = self.columns[name]
+            if sys.byteorder == 'big':
+                column.byteswap()
+            self.file.write(column.tobytes())
+            self.columns[name] = array(typecode)
+        self.file.flush()
+
+        self.events_written += self.size
+        self.size = 0
+        self.new_strings = []
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class TraceReader:
+    """Reads an event trace written by a `TraceWriter`. Chunks are loaded lazily when
+    iterating over the reader, and if "memory_map" is True the columns of each chunk
+    are NumPy arrays backed by a memory map of the file rather than copies of its
+    contents.
+
+    Locations, actions, and statuses are returned as integer codes into `strings`
+    unless chunks are decoded. The whole trace can be loaded with `read`, which returns
+    a dictionary of lists with the same keys as a pickled trace. Times and priorities
+    are stored as floats.
+    """
+    def __init__(self, path, memory_map=True):
+        self.path = path
+        self.memory_map = memory_map
+        # The empty string always has code 0
+        self.strings = ['']
+        # The offset and number of events of each chunk in the file
+        self.chunks = []
+
+        with open(path, 'rb') as trace_file:
+            magic, version = FILE_HEADER.unpack(trace_file.read(FILE_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not a Simantha trace file')
+            if version != VERSION:
+                raise ValueError(f'Unsupported trace file version {version}')
+
+            # Scan the chunk headers to build the string table and locate each chunk,
+            # stopping at an incomplete chunk left by an interrupted simulation
+            end = trace_file.seek(0, 2)
+            offset = FILE_HEADER.size
+            while offset + CHUNK_HEADER.size <= end:
+                trace_file.seek(offset)
+                size, string_count, string_length = CHUNK_HEADER.unpack(
+                    trace_file.read(CHUNK_HEADER.size)
+                )
+                strings = trace_file.read(string_length)
+                padding = -(offset + CHUNK_HEADER.size + string_length) % 8
+                data_offset = offset + CHUNK_HEADER.size + string_length + padding
+                chunk_end = data_offset + size * EVENT_SIZE
+                if chunk_end > end:
+                    break
+                if string_count > 0:
+                    self.strings.extend(strings.decode('utf-8').split('\0'))
+                self.chunks.append((data_offset, size))
+                offset = chunk_end
+
+        self.codes = {string: code for code, string in enumerate(self.strings)}
+
+    def __len__(self):
+        return sum(size for _, size in self.chunks)
+
+    def __iter__(self):
+        return self.iter_chunks()
+
+    def iter_chunks(self, decode=False):
+        """Iterate over the chunks of the trace. Each chunk is a dictionary of NumPy
+        arrays. If "decode" is True, codes are replaced by strings and the source of each
+        event is rendered as in a pickled trace.
+        """
+        if self.memory_map:
+            buffer = np.memmap(self.path, dtype=np.uint8, mode='r')
+            for offset, size in self.chunks:
+                chunk = self.read_columns(buffer, offset, size)
+                yield self.decode(chunk) if decode else chunk
+        else:
+            with open(self.path, 'rb') as trace_file:
+                for offset, size in self.chunks:
+                    trace_file.seek(offset)
+                    chunk = self.read_columns(
+                        trace_file.read(size * EVENT_SIZE), 0, size
+                    )
+                    yield self.decode(chunk) if decode else chunk
+
+    def read_columns(self, buffer, offset, size):
+        chunk = {}
+        for name, typecode in COLUMNS:
+            dtype = np.dtype(DTYPES[typecode])
+            chunk[name] = np.frombuffer(buffer, dtype, size, offset)
+            offset += size * dtype.itemsize
+        return chunk
+
+    def decode(self, chunk):
+        strings = np.array(self.strings, dtype=object)
+        decoded = {
+            'time': chunk['time'],
+            'location': strings[chunk['location']],
+            'action': strings[chunk['action']],
+            'source': np.array(
+                [
+                    self.render_source(*source) for source in zip(
+                        chunk['source_location'],
+                        chunk['source_action'],
+                        chunk['source_time']
+                    )
+                ],
+                dtype=object
+            ),
+            'priority': chunk['priority'],
+            'status': strings[chunk['status']],
+            'index': chunk['index']
+        }
+        return decoded
+
+    def render_source(self, location, action, time):
+        location = self.strings[location]
+        if action == 0:
+            return location
+        action = self.strings[action]
+        if math.isnan(time):
+            return f'{location}.{action}'
+        return f'{location}.{action} at {render_time(float(time))}'
+
+    def read(self):
+        """Load the whole trace as a dictionary of lists."""
+        trace = {
+            'time': [],
+            'location': [],
+            'action': [],
+            'source': [],
+            'priority': [],
+            'status': [],
+            'index': []
+        }
+        for chunk in self.iter_chunks(decode=True):
+            for name, values in trace.items():
+                values.extend(chunk[name].tolist())
+        return trace
+
+class TraceFilter:
+    """Selects the events recorded in a trace. Only events at one of "locations" (assets
+    or asset names), with one of "actions" (action names), executed between "start" and
+    "stop", and with one of "statuses" are traced. Criteria that are None are not
+    applied. If "sample" is greater than one, only every "sample"-th event that meets the
+    other criteria is traced.
+
+    For example, to trace only the maintenance of machine M1 after the warm up period:
+
+        trace_filter = TraceFilter(
+            locations=['M1'], actions=['maintain', 'restore'], start=warm_up_time
+        )
+        system.simulate(
+            warm_up_time, simulation_time, trace=True, trace_filter=trace_filter
+        )
+    """
+    def __init__(
+        self,
+        locations=None,
+        actions=None,
+        start=None,
+        stop=None,
+        statuses=None,
+        sample=1
+    ):
+        if locations is not None:
+            locations = {getattr(location, 'name', location) for location in locations}
+        self.locations = locations
+        self.actions = set(actions) if actions is not None else None
+        self.start = start if start is not None else float('-inf')
+        self.stop = stop if stop is not None else float('inf')
+        self.statuses = set(statuses) if statuses is not None else None
+        self.sample = sample
+        self.count = 0
+
+    def reset(self):
+        self.count = 0
+
+    def accepts(self, event, time):
+        """Returns True if the event, executed at "time", should be traced."""
+        if time < self.start or time > self.stop:
+            return False
+        if self.locations is not None and event.location.name not in self.locations:
+            return False
+        if self.actions is not None and event.action.__name__ not in self.actions:
+            return False
+        if self.statuses is not None:
+            status = 'canceled' if event.canceled else event.status
+            if status not in self.statuses:
+                return False
+        if self.sample > 1:
+            self.count += 1
+            return (self.count - 1) % self.sample == 0
+        return True
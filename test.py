@@ -1,10 +1,17 @@
+import copy
+import os
+import pickle
 import random
+import tempfile
 import unittest
 
 import scipy.stats
 
-from simantha import Source, Machine, Buffer, Sink, System
+from simantha import Source, Machine, Buffer, Sink, Maintainer, System
+from simantha.Maintainer import policies
+import simantha.data
 import simantha.simulation
+import simantha.trace
 import simantha.utils
 
 # Degradation transition matrix used for all tests where applicable
@@ -36,6 +43,48 @@ class UtilsTests(unittest.TestCase):
             degradation_matrix
         )
 
+class DataTests(unittest.TestCase):
+    """Tests for data collection containers.
+    """
+    def test_data_column(self):
+        # Data columns should behave like lists of numbers
+        column = simantha.data.DataColumn([0])
+        column.append(5)
+        self.assertEqual(column, [0, 5])
+        self.assertEqual(column[1:], [5])
+        self.assertEqual(column.index(5), 1)
+        self.assertEqual(column.count(5), 1)
+        self.assertEqual(column + [7], [0, 5, 7])
+        self.assertEqual([7] + column, [7, 0, 5])
+        self.assertEqual(column.copy(), [0, 5])
+
+        # Appending a float converts the column to floating point values
+        column.append(2.5)
+        self.assertEqual(list(column), [0, 5, 2.5])
+        self.assertEqual(column.to_numpy().dtype, float)
+
+        # Columns that cannot be converted only accept integers
+        column = simantha.data.DataColumn([0], widen=False)
+        with self.assertRaises(TypeError):
+            column.append(2.5)
+
+        # Deep copies should append to their own values
+        for duplicate in [copy.deepcopy(column), pickle.loads(pickle.dumps(column))]:
+            duplicate.append(1)
+            self.assertEqual(duplicate, [0, 1])
+        self.assertEqual(column, [0])
+
+    def test_categorical_column(self):
+        # Categorical columns should return the original values
+        column = simantha.data.CategoricalColumn(categories=['failure'])
+        column.append('failure')
+        column.append('repaired')
+        self.assertEqual(list(column), ['failure', 'repaired'])
+        self.assertEqual(column[-1], 'repaired')
+        self.assertEqual(column.count('failure'), 1)
+        self.assertEqual(column.count('begin maintenance'), 0)
+        self.assertEqual(list(column.to_numpy()), ['failure', 'repaired'])
+
 class SimulationTests(unittest.TestCase):
     """Tests for the underlying simulation engine. 
     """
@@ -70,6 +119,93 @@ class SimulationTests(unittest.TestCase):
 
         self.assertEqual(event_order, ['first event', 'middle event', 'last event'])
 
+    def test_event_calendar_order(self):
+        # Test that simultaneous events are popped according to their action priority
+        class Dummy:
+            def get_part(self):
+                pass
+
+            def request_space(self):
+                pass
+
+        dummy = Dummy()
+        env = simantha.simulation.Environment()
+        env.schedule_event(time=1, location=dummy, action=dummy.get_part)
+        env.schedule_event(time=1, location=dummy, action=dummy.request_space)
+        env.schedule_event(time=0, location=dummy, action=dummy.get_part)
+
+        popped = [env.events.pop() for _ in range(len(env.events))]
+        event_order = [(ev.time, ev.action.__name__) for ev in popped]
+
+        self.assertEqual(
+            event_order, [(0, 'get_part'), (1, 'request_space'), (1, 'get_part')]
+        )
+
+    def test_custom_event_priority(self):
+        # Test that the priority of a custom event type is used for ordering
+        class LateEvent(simantha.simulation.Event):
+            def get_action_priority(self):
+                return 100
+
+        def degrade():
+            pass
+
+        def sense():
+            pass
+
+        env = simantha.simulation.Environment()
+        env.schedule_event(time=0, location=None, action=sense, event_type=LateEvent)
+        env.schedule_event(time=0, location=None, action=degrade)
+
+        event_order = [ev.action.__name__ for ev in env.events]
+
+        self.assertEqual(event_order, ['degrade', 'sense'])
+
+    def test_event_cancellation(self):
+        # Test that canceling events only affects the given location and that
+        # canceled events are eventually removed from the calendar
+        def dummy_action():
+            pass
+
+        env = simantha.simulation.Environment()
+        env.compaction_minimum = 0
+        for time in range(3):
+            env.schedule_event(time=time, location='A', action=dummy_action)
+        env.schedule_event(time=1, location='B', action=dummy_action)
+
+        env.cancel_events('A')
+
+        self.assertEqual([ev.location for ev in env.events], ['B'])
+        self.assertFalse(env.location_events['A'])
+
+    def test_pending_actions(self):
+        # Test that pending actions are tracked as events are scheduled, executed, and
+        # canceled
+        def request_part():
+            pass
+
+        env = simantha.simulation.Environment()
+        env.schedule_event(time=0, location='A', action=request_part)
+        env.schedule_event(time=0, location='B', action=request_part)
+        self.assertTrue(env.has_pending('A', 'request_part'))
+
+        env.cancel_events('A')
+        self.assertFalse(env.has_pending('A', 'request_part'))
+        self.assertTrue(env.has_pending('B', 'request_part'))
+
+        env.run(simulation_time=1)
+        self.assertFalse(env.has_pending('B', 'request_part'))
+
+    def test_source_formatting(self):
+        # Test rendering of event provenance
+        self.assertEqual(
+            simantha.simulation.format_source(('M1', 'get_part', 5)), 'M1.get_part at 5'
+        )
+        self.assertEqual(
+            simantha.simulation.format_source(('M1', 'initialize')), 'M1.initialize'
+        )
+        self.assertEqual(simantha.simulation.format_source('custom'), 'custom')
+
     def test_constant_distribution(self):
         # Test sampling of a constant value
         constant = simantha.simulation.Distribution({'constant': 42})
@@ -82,14 +218,16 @@ class SimulationTests(unittest.TestCase):
         low, high = [10, 60]
         uniform = simantha.simulation.Distribution({'uniform': [low, high]})
         rvs = [uniform.sample() for _ in range(1000)]
+        observed = [rvs.count(value) for value in range(low, high+1)]
 
         # H_0: The sample is drawn from the specified distribution
-        _, p_value = scipy.stats.kstest(rvs, scipy.stats.randint(low, high+1).cdf)
+        _, p_value = scipy.stats.chisquare(observed)
 
         self.assertGreater(p_value, 0.05)
 
     def test_geometric_distribution(self):
         # Test sampling of a geometric distribution
+        random.seed(1)
         success = 1/100
         geometric = simantha.simulation.Distribution({'geometric': success})
         rvs = [geometric.sample() for _ in range(1000)]
@@ -156,6 +294,18 @@ class SingleMachineStochsticTests(unittest.TestCase):
         # Assert that the number of parts made is at most the simulation time
         self.assertLessEqual(system.machines[0].parts_made, 1000)
 
+    def test_time_to_degrade(self):
+        # The time spent in each health state should follow a geometric distribution
+        random.seed(1)
+        system = self.build_system()
+        machine = system.machines[0]
+        rvs = [machine.get_time_to_degrade() for _ in range(1000)]
+
+        # H_0: The mean time to degrade is that of a geometric distribution with p=0.1
+        _, p_value = scipy.stats.ttest_1samp(rvs, 1 / 0.1)
+
+        self.assertGreater(p_value, 0.05)
+
 
 class TwoMachineDeterministicTests(unittest.TestCase):
     """Tests for a two-machine one-buffer line. 
@@ -215,6 +365,536 @@ class TwoMachineStochasticTests(unittest.TestCase):
         
         self.assertLessEqual(system.machines[-1].parts_made, 1000)
 
+    def test_reproducibility(self):
+        # Simulations with the same seed should produce the same results
+        production = []
+        for _ in range(2):
+            random.seed(1)
+            system = self.build_system()
+            system.simulate(simulation_time=1000, verbose=False)
+            production.append([m.parts_made for m in system.machines])
+
+        self.assertEqual(production[0], production[1])
+
+    def test_statistics(self):
+        # Accumulated statistics should agree with the collected data
+        random.seed(1)
+        system = self.build_system()
+        system.simulate(simulation_time=1000, verbose=False, collect_statistics=True)
+        statistics = system.get_statistics()
+
+        for machine, machine_statistics in zip(system.machines, statistics['machines']):
+            self.assertAlmostEqual(
+                machine_statistics['availability']['mean'], 1 - machine.downtime / 1000
+            )
+            self.assertEqual(
+                machine_statistics['throughput']['count'], machine.parts_made
+            )
+
+        buffer = system.buffers[0]
+        times = list(buffer.level_data['time']) + [1000]
+        levels = list(buffer.level_data['level'])
+        mean_level = sum(
+            (times[i+1] - times[i]) * levels[i] for i in range(len(levels))
+        ) / 1000
+        self.assertAlmostEqual(statistics['buffers'][0]['level']['mean'], mean_level)
+
+    def test_operating_states(self):
+        # Time spent busy, blocked, starved, and down should account for the whole
+        # simulation after the warm up period
+        system = self.build_system()
+        system.simulate(warm_up_time=100, simulation_time=1000, verbose=False)
+        for machine in system.machines:
+            self.assertAlmostEqual(sum(machine.state_times.values()), 1000)
+            self.assertGreater(machine.busy_time, 0)
+        # The first machine is never starved after the warm up period
+        self.assertEqual(system.machines[0].starved_time, 0)
+
+    def test_binary_trace(self):
+        # A binary trace read back from disk should match the pickled trace, and
+        # reading should stop at an incomplete chunk
+        system = self.build_system()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                system.simulate(simulation_time=200, verbose=False, trace=True, seed=1)
+                with open('environment_trace.pkl', 'rb') as trace_file:
+                    expected = pickle.load(trace_file)
+                system.simulate(
+                    simulation_time=200,
+                    verbose=False,
+                    trace=True,
+                    seed=1,
+                    trace_format='binary'
+                )
+                for memory_map in [True, False]:
+                    reader = simantha.trace.TraceReader(
+                        'environment_trace.bin', memory_map
+                    )
+                    self.assertEqual(reader.read(), expected)
+
+                writer = simantha.trace.TraceWriter('chunks.bin', chunk_size=3)
+                with writer:
+                    for index in range(10):
+                        source = ('M1', 'degrade', 0)
+                        writer.write(index, 'M1', 'degrade', source, 0, '', index)
+                self.assertEqual(len(simantha.trace.TraceReader('chunks.bin')), 10)
+                # Remove part of the last chunk
+                os.truncate('chunks.bin', os.path.getsize('chunks.bin') - 10)
+                reader = simantha.trace.TraceReader('chunks.bin')
+                self.assertEqual(reader.read()['index'], list(range(9)))
+            finally:
+                os.chdir(cwd)
+
+    def test_trace_filter(self):
+        # Filtered traces should contain only the selected events
+        system = self.build_system()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                system.simulate(simulation_time=500, verbose=False, trace=True, seed=1)
+                with open('environment_trace.pkl', 'rb') as trace_file:
+                    full_trace = pickle.load(trace_file)
+                expected = [
+                    index for index, location, action, time in zip(
+                        full_trace['index'],
+                        full_trace['location'],
+                        full_trace['action'],
+                        full_trace['time']
+                    )
+                    if location == 'M1' and action == 'degrade' and time >= 100
+                ]
+
+                trace_filter = simantha.trace.TraceFilter(
+                    locations=['M1'], actions=['degrade'], start=100, sample=2
+                )
+                system.simulate(
+                    simulation_time=500,
+                    verbose=False,
+                    trace=True,
+                    seed=1,
+                    trace_filter=trace_filter
+                )
+                with open('environment_trace.pkl', 'rb') as trace_file:
+                    filtered_trace = pickle.load(trace_file)
+                self.assertEqual(filtered_trace['index'], expected[::2])
+            finally:
+                os.chdir(cwd)
+
+    def test_observers(self):
+        # Observers should see the events they are registered for without changing the
+        # simulation
+        system = self.build_system()
+        system.simulate(simulation_time=1000, verbose=False, seed=1)
+        production = [m.parts_made for m in system.machines]
+
+        M1 = system.machines[0]
+        restores = []
+        before, after = [], []
+        system.register_observer(restores.append, action='restore', location=M1)
+        system.register_observer(
+            lambda event: before.append(event.location.has_part),
+            action='put_part',
+            when='before'
+        )
+        system.register_observer(
+            lambda event: after.append(event.location.has_part), action='put_part'
+        )
+        system.simulate(simulation_time=1000, verbose=False, seed=1)
+
+        self.assertEqual([m.parts_made for m in system.machines], production)
+        self.assertEqual(len(restores), M1.maintenance_data['event'].count('repaired'))
+        self.assertTrue(all(restore.location is M1 for restore in restores))
+        self.assertTrue(all(before) and not any(after))
+        self.assertGreater(len(before), 0)
+
+        # Removed observers should not be called by later simulations
+        system.remove_observer(restores.append, action='restore', location=M1)
+        restore_count = len(restores)
+        system.simulate(simulation_time=1000, verbose=False, seed=1)
+        self.assertEqual(len(restores), restore_count)
+        self.assertTrue(system.env.observed)
+        with self.assertRaises(ValueError):
+            system.remove_observer(restores.append, action='restore', location=M1)
+
+        system.clear_observers()
+        before_count = len(before)
+        system.simulate(simulation_time=1000, verbose=False, seed=1)
+        self.assertEqual(len(before), before_count)
+        self.assertFalse(system.env.observed)
+
+    def test_environment_observers(self):
+        # Removing an environment's last observer should stop it checking for them
+        def dummy_action():
+            pass
+
+        env = simantha.simulation.Environment()
+        observed = []
+        env.add_observer(observed.append, action=dummy_action)
+        env.add_observer(observed.append, when='before')
+        env.remove_observer(observed.append, action=dummy_action)
+        self.assertTrue(env.observed)
+        env.remove_observer(observed.append, when='before')
+        self.assertFalse(env.observed)
+        with self.assertRaises(ValueError):
+            env.remove_observer(observed.append)
+
+        env.add_observer(observed.append)
+        env.clear_observers()
+        env.schedule_event(time=0, location=None, action=dummy_action)
+        env.run(simulation_time=1)
+        self.assertEqual(observed, [])
+
+    def test_profile(self):
+        # Profiled event counts should agree with the simulation
+        system = self.build_system()
+        system.simulate(simulation_time=1000, verbose=False, profile=True)
+        profile = system.profile
+
+        actions = profile.by_action()
+        M1 = system.machines[0]
+        self.assertEqual(
+            profile.events[('M1', 'restore')][0],
+            M1.maintenance_data['event'].count('repaired')
+        )
+        self.assertEqual(
+            actions['put_part']['executed'],
+            sum([m.parts_made for m in system.machines])
+        )
+        self.assertEqual(
+            sum([total['executed'] for total in actions.values()]),
+            sum([total['executed'] for total in profile.by_asset().values()])
+        )
+        self.assertGreater(profile.peak_queue_length, 0)
+        self.assertGreater(profile.events_per_second, 0)
+
+    def test_fused_transfers(self):
+        # Fusing part transfers should not change the sample path
+        production = []
+        for fuse_transfers in [False, True]:
+            random.seed(1)
+            system = self.build_system()
+            for machine in system.machines:
+                machine.cycle_time = simantha.simulation.Distribution({'uniform': [1, 5]})
+                machine.fuse_transfers = fuse_transfers
+            system.simulate(simulation_time=1000, verbose=False)
+            production.append([m.parts_made for m in system.machines])
+
+        self.assertEqual(production[0], production[1])
+
+
+class RoutingTests(unittest.TestCase):
+    """Tests for compiling the routing of a system."""
+    def test_compile_routing(self):
+        system = TwoMachineStochasticTests().build_system()
+        system.compile_routing()
+        M1, M2 = system.machines
+        self.assertEqual(M1.givers, tuple(system.sources))
+        self.assertEqual(M1.receivers, tuple(system.buffers))
+        self.assertEqual(M2.givers, tuple(system.buffers))
+
+        # Routing should be defined on both assets of a connection
+        system.buffers[0].define_routing(upstream=system.machines[:1])
+        with self.assertRaises(ValueError):
+            system.compile_routing()
+
+    def test_multiple_neighbors(self):
+        # Parts should be sent to every receiver that can accept them
+        source = Source()
+        M1 = Machine('M1', cycle_time=1)
+        buffers = [Buffer(f'B{b}', capacity=2) for b in range(1, 3)]
+        receivers = [Machine(f'M{m}', cycle_time=3) for m in range(2, 4)]
+        sink = Sink()
+        source.define_routing(downstream=[M1])
+        M1.define_routing(upstream=[source], downstream=buffers)
+        for buffer, machine in zip(buffers, receivers):
+            buffer.define_routing(upstream=[M1], downstream=[machine])
+            machine.define_routing(upstream=[buffer], downstream=[sink])
+        sink.define_routing(upstream=receivers)
+
+        system = System([source, M1] + buffers + receivers + [sink])
+        system.simulate(simulation_time=1000, verbose=False)
+        for machine in receivers:
+            self.assertGreater(machine.parts_made, 300)
+
+    def test_available_neighbors(self):
+        # Buffers should keep the available givers and receivers of machines with
+        # several of them up to date
+        source = Source()
+        M1 = Machine('M1', cycle_time=1)
+        buffers = [Buffer(f'B{b}', capacity=2) for b in range(1, 3)]
+        M2 = Machine('M2', cycle_time=2)
+        sink = Sink()
+        source.define_routing(downstream=[M1])
+        M1.define_routing(upstream=[source], downstream=buffers)
+        for buffer in buffers:
+            buffer.define_routing(upstream=[M1], downstream=[M2])
+        M2.define_routing(upstream=buffers, downstream=[sink])
+        sink.define_routing(upstream=[M2])
+
+        def check_availability(event):
+            self.assertEqual(
+                set(M1.available_receivers), {b for b in buffers if b.can_receive()}
+            )
+            self.assertEqual(
+                set(M2.available_givers), {b for b in buffers if b.can_give()}
+            )
+        system = System([source, M1] + buffers + [M2, sink])
+        system.register_observer(check_availability)
+        system.simulate(simulation_time=200, verbose=False)
+        self.assertGreater(M2.parts_made, 90)
+
+    def test_wait_lists(self):
+        # Machines in wide stations should be woken when parts or space become
+        # available, and only starved machines should be left waiting
+        source = Source()
+        station1 = [Machine(f'M1_{m}', cycle_time=10) for m in range(10)]
+        B1 = Buffer('B1', capacity=3)
+        station2 = [Machine(f'M2_{m}', cycle_time=10) for m in range(10)]
+        sink = Sink()
+        source.define_routing(downstream=station1)
+        for machine in station1:
+            machine.define_routing(upstream=[source], downstream=[B1])
+        B1.define_routing(upstream=station1, downstream=station2)
+        for machine in station2:
+            machine.define_routing(upstream=[B1], downstream=[sink])
+        sink.define_routing(upstream=station2)
+
+        system = System([source] + station1 + [B1] + station2 + [sink])
+        system.simulate(simulation_time=1000, verbose=False)
+        self.assertEqual(sink.level, 990)
+        for machine in B1.waiting_consumers:
+            self.assertFalse(machine.has_part)
+        self.assertEqual(B1.waiting_producers, {})
+
+class MaintainerTests(unittest.TestCase):
+    """Tests for choosing machines to maintain."""
+    def build_system(self, maintainer):
+        source = Source()
+        machines = [
+            Machine(
+                f'M{m}',
+                cycle_time=1,
+                degradation_matrix=degradation_matrix,
+                cbm_threshold=3,
+                pm_distribution={'geometric': 0.1},
+                cm_distribution={'geometric': 0.05}
+            )
+            for m in range(5)
+        ]
+        sink = Sink()
+        source.define_routing(downstream=machines)
+        for machine in machines:
+            machine.define_routing(upstream=[source], downstream=[sink])
+        sink.define_routing(upstream=machines)
+
+        return System([source] + machines + [sink], maintainer)
+
+    def test_fifo_queue(self):
+        # The queued machine chosen by the default policy should be one that entered
+        # the queue earliest
+        chosen = []
+        class CheckedMaintainer(Maintainer):
+            def get_next_in_queue(maintainer):
+                machine = super().get_next_in_queue()
+                queue = maintainer.get_queue()
+                if machine is not None:
+                    chosen.append(machine)
+                    self.assertEqual(
+                        machine.time_entered_queue,
+                        min(m.time_entered_queue for m in queue)
+                    )
+                else:
+                    self.assertEqual(queue, [])
+                return machine
+
+        system = self.build_system(CheckedMaintainer(capacity=1))
+        system.simulate(simulation_time=2000, verbose=False)
+        self.assertGreater(len(chosen), 0)
+
+    def test_policies(self):
+        # Each policy should choose a queued machine with the lowest key
+        for policy in ['fifo', 'lpt', 'spt', 'health']:
+            key = policies[policy]
+            chosen = []
+            class CheckedMaintainer(Maintainer):
+                def get_next_in_queue(maintainer):
+                    machine = super().get_next_in_queue()
+                    if machine is not None:
+                        chosen.append(machine)
+                        self.assertEqual(
+                            key(machine), min(key(m) for m in maintainer.get_queue())
+                        )
+                    return machine
+
+            system = self.build_system(CheckedMaintainer(capacity=1, policy=policy))
+            for machine in system.machines[::2]:
+                machine.pm_distribution = simantha.simulation.Distribution(
+                    {'geometric': 0.2}
+                )
+            system.simulate(simulation_time=2000, verbose=False)
+            self.assertGreater(len(chosen), 0)
+
+    def test_custom_policy(self):
+        # An overridden choose_maintenance_action should receive the queued machines
+        queues = []
+        class LastInFirstOutMaintainer(Maintainer):
+            def choose_maintenance_action(self, queue):
+                queues.append([machine.in_queue for machine in queue])
+                return max(queue, key=lambda machine: machine.time_entered_queue)
+
+        system = self.build_system(LastInFirstOutMaintainer(capacity=1))
+        system.simulate(simulation_time=2000, verbose=False)
+        self.assertGreater(len(queues), 0)
+        self.assertTrue(all(all(queue) for queue in queues))
+
+    def test_custom_policy_queue_bounded(self):
+        # A maintainer with a custom policy should not accumulate unused heap entries
+        class LastInFirstOutMaintainer(Maintainer):
+            def choose_maintenance_action(self, queue):
+                return max(queue, key=lambda machine: machine.time_entered_queue)
+
+        maintainer = LastInFirstOutMaintainer(capacity=1)
+        system = self.build_system(maintainer)
+        system.simulate(simulation_time=20000, verbose=False)
+        self.assertLessEqual(len(maintainer.queue_heap), len(system.machines))
+
+    def test_multiple_maintainers(self):
+        # Each maintainer should only service its own machines within its capacity
+        electrical = Maintainer('electrical', capacity=1)
+        mechanical = Maintainer('mechanical', capacity=2)
+        system = self.build_system([electrical, mechanical])
+        electrical.machines = system.machines[:3]
+        mechanical.machines = system.machines[2:]
+
+        serviced = {electrical: set(), mechanical: set()}
+        def check_maintenance(event):
+            machine = event.location
+            maintainer = machine.assigned_maintainer
+            serviced[maintainer].add(machine)
+            self.assertLessEqual(maintainer.utilization, maintainer.capacity)
+        system.register_observer(check_maintenance, action='maintain')
+        system.simulate(simulation_time=2000, verbose=False)
+
+        self.assertTrue(serviced[electrical] <= set(system.machines[:3]))
+        self.assertTrue(serviced[mechanical] <= set(system.machines[2:]))
+        self.assertGreater(len(serviced[electrical]), 0)
+        self.assertGreater(len(serviced[mechanical]), 0)
+        self.assertEqual(system.maintainer, electrical)
+
+    def test_unmaintained_machine(self):
+        # A degrading machine that no maintainer services should be rejected
+        maintainer = Maintainer(capacity=1)
+        system = self.build_system(maintainer)
+        maintainer.machines = system.machines[:2]
+        with self.assertRaises(ValueError):
+            system.simulate(simulation_time=100, verbose=False)
+
+        # Machines that never request maintenance do not need a maintainer
+        for machine in system.machines[2:]:
+            machine.degradation_matrix = [[1, 0], [0, 1]]
+            machine.cbm_threshold = 1
+        system.simulate(simulation_time=100, verbose=False)
+
+class ReplicationTests(unittest.TestCase):
+    """Tests for simulating multiple replications of a system."""
+    def build_system(self):
+        return TwoMachineStochasticTests().build_system()
+
+    def test_replication_streams(self):
+        # Replications should not depend on the number of jobs and should be
+        # reproducible individually
+        system = self.build_system()
+        serial = system.iterate_simulation(
+            replications=4, simulation_time=500, verbose=False, jobs=1, seedseed=1
+        )
+        parallel = system.iterate_simulation(
+            replications=4, simulation_time=500, verbose=False, jobs=2, seedseed=1
+        )
+        self.assertEqual(
+            [r[:3] for r in serial], [r[:3] for r in parallel]
+        )
+
+        system.simulate(
+            simulation_time=500, verbose=False, seed=System.replication_seed(1, 2)
+        )
+        self.assertEqual(sum([s.level for s in system.sinks]), serial[2][0])
+
+    def test_global_random_state(self):
+        # A seeded simulation should not draw from Python's global random module
+        system = self.build_system()
+        random.seed(1)
+        state = random.getstate()
+        system.simulate(simulation_time=500, verbose=False, seed=1)
+        self.assertEqual(random.getstate(), state)
+
+    def test_system_state(self):
+        # Stored system states should contain the data collected by each machine
+        system = self.build_system()
+        samples = system.iterate_simulation(
+            replications=2, simulation_time=500, store_system_state=True, verbose=False
+        )
+        for production, machine_production, _, state, _ in samples:
+            self.assertEqual(
+                [m.parts_made for m in state.machines], machine_production
+            )
+            self.assertEqual(
+                state.machines[-1].production_data['production'][-1],
+                machine_production[-1]
+            )
+
+    def test_unnamed_machines(self):
+        # Results of each machine should be kept when machines have the default name
+        source = Source()
+        machines = [Machine(cycle_time=1) for _ in range(3)]
+        buffers = [Buffer() for _ in range(2)]
+        sink = Sink()
+        source.define_routing(downstream=machines[:1])
+        for m, machine in enumerate(machines):
+            upstream = [source] if m == 0 else [buffers[m-1]]
+            downstream = [sink] if m == 2 else [buffers[m]]
+            machine.define_routing(upstream=upstream, downstream=downstream)
+        for b, buffer in enumerate(buffers):
+            buffer.define_routing(upstream=[machines[b]], downstream=[machines[b+1]])
+        sink.define_routing(upstream=machines[-1:])
+        system = System([source] + machines + buffers + [sink])
+
+        samples = system.iterate_simulation(
+            replications=1, simulation_time=100, verbose=False
+        )
+        state_times = samples[0][4]
+        self.assertEqual(len(state_times), 3)
+        for times in state_times:
+            self.assertAlmostEqual(sum(times.values()), 100)
+
+        system.simulate(simulation_time=100, verbose=False, collect_statistics=True)
+        statistics = system.get_statistics()
+        self.assertEqual(len(statistics['machines']), 3)
+        self.assertEqual(len(statistics['buffers']), 2)
+        for machine, machine_statistics in zip(machines, statistics['machines']):
+            self.assertEqual(
+                machine_statistics['throughput']['count'], machine.parts_made
+            )
+
+    def test_replication_runner(self):
+        # A runner should be reusable and give the same results as iterate_simulation
+        system = self.build_system()
+        expected = system.iterate_simulation(
+            replications=4, simulation_time=500, verbose=False, seedseed=3
+        )
+        with system.replication_runner(jobs=2) as runner:
+            for _ in range(2):
+                samples = system.iterate_simulation(
+                    replications=4,
+                    simulation_time=500,
+                    verbose=False,
+                    seedseed=3,
+                    runner=runner
+                )
+                self.assertEqual(samples, expected)
+
 
 if __name__ == '__main__':
     random.seed(1)